@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Biometric Devices Management',
-    'version': '1.0.0',
+    'version': '1.1.0',
     'category': 'Human Resources',
     'summary': 'Gestión de dispositivos biométricos para autenticación de usuarios',
     'description': """
@@ -22,19 +22,24 @@
         - Estados: activo, inactivo, revocado
         - Historial de autenticaciones
     """,
-    'depends': ['base', 'hr', 'mail'],
+    'depends': ['base', 'web', 'hr', 'mail', 'bus'],
     'data': [
         # 1. Seguridad primero
         'security/biometric_security.xml',
         'security/ir.model.access.csv',
-        # 2. Vistas de logs (contiene action_biometric_auth_log_by_device)
+        # 2. Vistas de logs y estadísticas (acciones por dispositivo)
         'views/biometric_auth_log_views.xml',
-        # 3. Vistas de dispositivos (usa action_biometric_auth_log_by_device)
+        'views/biometric_auth_stats_views.xml',
+        # 3. Vistas de dispositivos (usa las acciones por dispositivo)
         'views/biometric_device_views.xml',
+        'views/biometric_job_views.xml',
+        'views/biometric_user_summary_views.xml',
+        'views/biometric_erasure_request_views.xml',
         # 4. Menús al final
         'views/biometric_menu.xml',
         # 5. Datos por defecto
         'data/biometric_data.xml',
+        'data/biometric_cron.xml',
     ],
     'demo': [],
     'installable': True,
@@ -1 +1,2 @@
-from . import biometric_api
\ No newline at end of file
+from . import biometric_api
+from . import biometric_dataset
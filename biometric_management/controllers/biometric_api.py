@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
-from odoo import http
-from odoo.http import request, Response
+from odoo import http, api, fields
+from odoo.http import request, Response, content_disposition
+from odoo.service.model import PG_CONCURRENCY_EXCEPTIONS_TO_RETRY
+from odoo.addons.biometric_management.models.biometric_auth_log import EXPORT_COLUMNS
+from odoo.addons.biometric_management import replica
+import csv
+import io
 import json
 import logging
 from datetime import datetime
 
 _logger = logging.getLogger(__name__)
 
+# Máximo de operaciones por llamada a /api/biometric/batch
+BATCH_MAX_ITEMS = 50
+
 
 class BiometricAPIController(http.Controller):
     """
@@ -67,7 +75,8 @@ class BiometricAPIController(http.Controller):
             "biometric_type": "fingerprint|facial_recognition|iris",
             "biometric_type_display": "string",
             "is_physical_device": boolean,
-            "device_info_json": "string"
+            "device_info_json": "string",
+            "idempotency_key": "string"  (opcional, generada por la app)
         }
         
         Returns: {
@@ -85,7 +94,7 @@ class BiometricAPIController(http.Controller):
                         'error': f'Campo requerido faltante: {field}'
                     }
 
-            # Registrar dispositivo
+            # Registrar dispositivo (un reintento con la misma clave no vuelve a escribir)
             BiometricDevice = request.env['biometric.device']
             device_data = BiometricDevice.register_device(kwargs)
 
@@ -101,6 +110,8 @@ class BiometricAPIController(http.Controller):
                 'message': 'Dispositivo registrado exitosamente'
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error registrando dispositivo: {str(e)}')
             return {
@@ -112,15 +123,17 @@ class BiometricAPIController(http.Controller):
                 type='json', 
                 auth='user', 
                 methods=['GET'], 
-                csrf=False)
-    def get_devices(self, current_device_id=None, **kwargs):
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_devices(self, current_device_id=None, fields=None, **kwargs):
         """
         Obtiene todos los dispositivos del usuario actual
         
-        GET /api/biometric/devices?current_device_id=abc123
+        GET /api/biometric/devices?current_device_id=abc123&fields=deviceName,state
         
         Args:
             current_device_id (str): ID del dispositivo desde donde se hace la petición
+            fields (list|str): Claves a devolver por dispositivo (opcional, por defecto todas)
         
         Returns: {
             "success": true,
@@ -137,14 +150,10 @@ class BiometricAPIController(http.Controller):
                 ('state', '!=', 'revoked')
             ], order='last_used_at desc, enrolled_at desc')
             
-            # Formatear con contexto del dispositivo actual
-            devices = []
-            for device in devices_records:
-                # Pasar current_device_id al contexto
-                device_data = device.with_context(
-                    current_device_id=current_device_id
-                )._format_device_data()
-                devices.append(device_data)
+            # Formatear con contexto del dispositivo actual (estadísticas en lote)
+            devices = devices_records.with_context(
+                current_device_id=current_device_id
+            )._format_devices_data(fields)
 
             return {
                 'success': True,
@@ -152,6 +161,8 @@ class BiometricAPIController(http.Controller):
                 'count': len(devices)
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error obteniendo dispositivos: {str(e)}')
             return {
@@ -163,12 +174,13 @@ class BiometricAPIController(http.Controller):
                 type='json', 
                 auth='user', 
                 methods=['GET'], 
-                csrf=False)
-    def get_device(self, device_id, **kwargs):
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_device(self, device_id, fields=None, **kwargs):
         """
         Obtiene información de un dispositivo específico
         
-        GET /api/biometric/devices/{device_id}
+        GET /api/biometric/devices/{device_id}?fields=deviceName,authCount
         
         Returns: {
             "success": true,
@@ -193,9 +205,11 @@ class BiometricAPIController(http.Controller):
 
             return {
                 'success': True,
-                'data': device._format_device_data()
+                'data': device._format_device_data(fields)
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error obteniendo dispositivo {device_id}: {str(e)}')
             return {
@@ -247,6 +261,8 @@ class BiometricAPIController(http.Controller):
                 'message': 'Dispositivo revocado exitosamente'
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error revocando dispositivo {device_id}: {str(e)}')
             return {
@@ -293,6 +309,8 @@ class BiometricAPIController(http.Controller):
                 'message': 'Dispositivo activado exitosamente'
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error activando dispositivo {device_id}: {str(e)}')
             return {
@@ -322,7 +340,8 @@ class BiometricAPIController(http.Controller):
                 "message": "string"
             },
             "session_id": "string",
-            "duration_ms": int
+            "duration_ms": int,
+            "idempotency_key": "string"  (opcional, generada por la app)
         }
         
         Returns: {
@@ -347,11 +366,14 @@ class BiometricAPIController(http.Controller):
                 device_id=device_id,
                 success=success,
                 error_info=error_info,
-                session_id=session_id
+                session_id=session_id,
+                idempotency_key=kwargs.get('idempotency_key'),
             )
 
             return result
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error registrando autenticación: {str(e)}')
             return {
@@ -363,12 +385,13 @@ class BiometricAPIController(http.Controller):
                 type='json', 
                 auth='user', 
                 methods=['GET'], 
-                csrf=False)
-    def get_auth_history(self, limit=50, **kwargs):
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_auth_history(self, limit=50, fields=None, **kwargs):
         """
         Obtiene el historial de autenticaciones del usuario
         
-        GET /api/biometric/auth/history?limit=50
+        GET /api/biometric/auth/history?limit=50&fields=auth_date,success
         
         Returns: {
             "success": true,
@@ -378,7 +401,7 @@ class BiometricAPIController(http.Controller):
         """
         try:
             AuthLog = request.env['biometric.auth.log']
-            history = AuthLog.get_user_auth_history(limit=limit)
+            history = AuthLog.get_user_auth_history(limit=limit, requested_fields=fields)
 
             return {
                 'success': True,
@@ -386,6 +409,8 @@ class BiometricAPIController(http.Controller):
                 'count': len(history)
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error obteniendo historial: {str(e)}')
             return {
@@ -393,11 +418,64 @@ class BiometricAPIController(http.Controller):
                 'error': str(e)
             }
 
+    @http.route('/api/biometric/devices/stats', 
+                type='json', 
+                auth='user', 
+                methods=['GET'], 
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_devices_stats(self, date_from=None, date_to=None, **kwargs):
+        """
+        Estadísticas de autenticación de todos los dispositivos del usuario actual
+        (una sola consulta agregada)
+        
+        GET /api/biometric/devices/stats?date_from=2024-01-01&date_to=2024-02-01
+        
+        Returns: {
+            "success": true,
+            "data": [{
+                "device_id": int,
+                "total_attempts": int,
+                "successful": int,
+                "failed": int,
+                "success_rate": float,
+                "last_auth": "datetime",
+                "avg_duration_ms": int
+            }]
+        }
+        """
+        try:
+            devices = request.env['biometric.device'].search([
+                ('user_id', '=', request.env.user.id)
+            ], order='last_used_at desc, enrolled_at desc')
+
+            stats = request.env['biometric.auth.log'].get_devices_auth_stats(
+                devices.ids,
+                date_from=fields.Datetime.to_datetime(date_from) if date_from else None,
+                date_to=fields.Datetime.to_datetime(date_to) if date_to else None,
+            )
+
+            return {
+                'success': True,
+                'data': [dict(stats[device_id], device_id=device_id) for device_id in devices.ids],
+                'count': len(devices)
+            }
+
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
+        except Exception as e:
+            _logger.error(f'Error obteniendo estadísticas de dispositivos: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
     @http.route('/api/biometric/devices/<int:device_id>/stats', 
                 type='json', 
                 auth='user', 
                 methods=['GET'], 
-                csrf=False)
+                csrf=False,
+                readonly=replica.readonly_route)
     def get_device_stats(self, device_id, **kwargs):
         """
         Obtiene estadísticas de autenticación de un dispositivo
@@ -439,6 +517,8 @@ class BiometricAPIController(http.Controller):
                 'data': stats
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error obteniendo estadísticas: {str(e)}')
             return {
@@ -446,6 +526,437 @@ class BiometricAPIController(http.Controller):
                 'error': str(e)
             }
 
+    @http.route('/api/biometric/users/summary', 
+                type='json', 
+                auth='user', 
+                methods=['POST'], 
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_user_summary(self, user_id=None, **kwargs):
+        """
+        Resumen biométrico de un usuario (una sola fila materializada)
+        
+        POST /api/biometric/users/summary
+        Body: {
+            "user_id": int  (opcional; otros usuarios solo para managers)
+        }
+        
+        Returns: {
+            "success": true,
+            "data": {
+                "userId": int,
+                "deviceCount": int,
+                "activeDeviceCount": int,
+                "activeSessionCount": int,
+                "lastLoginAt": "datetime",
+                "lastFailureAt": "datetime",
+                "failureStreak": int,
+                "version": int
+            }
+        }
+        """
+        try:
+            Summary = request.env['biometric.user.summary']
+            return {
+                'success': True,
+                'data': Summary.get_user_summary(user_id=user_id or None)
+            }
+
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
+        except Exception as e:
+            _logger.error(f'Error obteniendo resumen de usuario: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    # ============================================
+    # ENDPOINTS - Arranque de la App
+    # ============================================
+
+    @http.route('/api/biometric/bootstrap', 
+                type='json', 
+                auth='user', 
+                methods=['POST'], 
+                csrf=False)
+    def bootstrap(self, device_id=None, history_limit=20, device_fields=None,
+                  log_fields=None, **kwargs):
+        """
+        Datos de arranque de la app en una sola llamada
+        
+        Reemplaza la secuencia validate_device → /devices/current → /devices →
+        get_active_sessions → /auth/history.
+        
+        POST /api/biometric/bootstrap
+        Body: {
+            "device_id": "string",
+            "history_limit": int,
+            "device_fields": [...],
+            "log_fields": [...]
+        }
+        
+        Returns: {
+            "success": true,
+            "data": {
+                "validation": {...},
+                "current_device": {...device_data} | null,
+                "devices": [...devices],
+                "active_sessions": [...sessions],
+                "history": {records, total, limit, offset, has_more}
+            }
+        }
+        """
+        try:
+            BiometricDevice = request.env['biometric.device']
+            data = BiometricDevice.get_bootstrap_data(
+                device_id=device_id,
+                history_limit=history_limit,
+                device_fields=device_fields,
+                log_fields=log_fields,
+            )
+
+            return {
+                'success': True,
+                'data': data
+            }
+
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
+        except Exception as e:
+            _logger.error(f'Error en bootstrap: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    # ============================================
+    # ENDPOINTS - Sincronización
+    # ============================================
+
+    @http.route('/api/biometric/sync', 
+                type='json', 
+                auth='user', 
+                methods=['POST'], 
+                csrf=False)
+    def sync(self, watermark=None, current_device_id=None, limit=None,
+             device_fields=None, log_fields=None, **kwargs):
+        """
+        Sincronización delta de dispositivos e historial
+        
+        POST /api/biometric/sync
+        Body: {
+            "watermark": "string",  (devuelto por la sincronización anterior; omitir = completa)
+            "current_device_id": "string",
+            "limit": int,
+            "device_fields": [...],
+            "log_fields": [...]
+        }
+        
+        Returns: {
+            "success": true,
+            "data": {
+                "watermark": "string",
+                "full_sync": bool,
+                "devices": [...devices],
+                "removed_devices": [{id, deviceId, reason}],
+                "logs": [...logs],
+                "has_more": bool
+            }
+        }
+        """
+        try:
+            BiometricDevice = request.env['biometric.device']
+            changes = BiometricDevice.get_sync_changes(
+                watermark=watermark,
+                current_device_id=current_device_id,
+                limit=limit,
+                device_fields=device_fields,
+                log_fields=log_fields,
+            )
+
+            return {
+                'success': True,
+                'data': changes
+            }
+
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
+        except Exception as e:
+            _logger.error(f'Error sincronizando: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    # ============================================
+    # ENDPOINTS - Administración
+    # ============================================
+
+    @http.route('/api/biometric/dashboard', 
+                type='json', 
+                auth='user', 
+                methods=['POST'], 
+                csrf=False,
+                readonly=replica.readonly_route)
+    def get_dashboard(self, days=None, top=None, **kwargs):
+        """
+        Tablero de salud de la flota (solo managers)
+        
+        POST /api/biometric/dashboard
+        Body: {
+            "days": int,  (ventana para fallos, por defecto 14)
+            "top": int    (dispositivos con más fallos, por defecto 10)
+        }
+        
+        Returns: {
+            "success": true,
+            "data": {
+                "fleet": [{platform, biometricType, active, inactive, revoked, stale}],
+                "totals": {...},
+                "stale_devices": int,
+                "failure_rates": [{day, attempts, failures, failure_rate}],
+                "top_failing_devices": [...]
+            }
+        }
+        """
+        if not request.env.user.has_group('biometric_management.group_biometric_manager'):
+            return {
+                'success': False,
+                'error': 'No tienes permiso para acceder al tablero'
+            }
+
+        try:
+            Dashboard = request.env['biometric.dashboard']
+            params = {}
+            if days:
+                params['days'] = days
+            if top:
+                params['top'] = top
+
+            return {
+                'success': True,
+                'data': Dashboard.get_manager_dashboard(**params)
+            }
+
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
+        except Exception as e:
+            _logger.error(f'Error obteniendo tablero: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    @http.route('/api/biometric/admin/auth/export', 
+                type='http', 
+                auth='user', 
+                methods=['GET'], 
+                csrf=False)
+    def export_auth_logs(self, format='csv', date_from=None, date_to=None,
+                         user_id=None, device_id=None, success=None, **kwargs):
+        """
+        Exporta logs de autenticación en streaming (solo administradores)
+        
+        GET /api/biometric/admin/auth/export?format=csv|ndjson
+            &date_from=2024-01-01&date_to=2024-07-01&user_id=7&device_id=12&success=false
+        
+        La respuesta se emite por chunks a medida que se leen los lotes del
+        cursor del servidor, por lo que empieza a llegar de inmediato y la
+        memoria se mantiene constante.
+        
+        Returns: text/csv o application/x-ndjson
+        """
+        if not request.env.user.has_group('biometric_management.group_biometric_admin'):
+            return self._error_response(
+                'Solo administradores pueden exportar logs',
+                'FORBIDDEN',
+                403
+            )
+
+        if format not in ('csv', 'ndjson'):
+            return self._error_response('Formato no soportado (csv|ndjson)', 'INVALID_FORMAT')
+
+        try:
+            filters = {
+                'date_from': fields.Datetime.to_datetime(date_from) if date_from else None,
+                'date_to': fields.Datetime.to_datetime(date_to) if date_to else None,
+                'user_id': int(user_id) if user_id else None,
+                'device_id': int(device_id) if device_id else None,
+                'success': None if success in (None, '') else success.lower() in ('1', 'true'),
+            }
+        except ValueError as e:
+            return self._error_response(f'Filtro inválido: {str(e)}', 'INVALID_FILTER')
+
+        registry = request.env.registry
+        uid = request.env.uid
+
+        def encode_csv(rows, header=False):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if header:
+                writer.writerow(EXPORT_COLUMNS)
+            writer.writerows(
+                [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                for row in rows
+            )
+            return buffer.getvalue().encode('utf-8')
+
+        def encode_ndjson(rows):
+            return ''.join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=str) + '\n'
+                for row in rows
+            ).encode('utf-8')
+
+        def generate():
+            # El cursor de la petición ya está cerrado cuando se consume la respuesta.
+            # Solo lectura: usa la réplica si está configurada y, en el primario, no
+            # deja una transacción de escritura abierta durante toda la descarga
+            with registry.cursor(readonly=True) as cr:
+                env = api.Environment(cr, uid, {})
+                if format == 'csv':
+                    yield encode_csv([], header=True)
+                for rows in env['biometric.auth.log']._iter_export_rows(**filters):
+                    yield encode_csv(rows) if format == 'csv' else encode_ndjson(rows)
+            _logger.info(f'Exportación de logs ({format}) completada por usuario {uid}')
+
+        filename = f'biometric_auth_logs.{format}'
+        mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        return Response(
+            generate(),
+            mimetype=mimetype,
+            headers=[
+                ('Content-Disposition', content_disposition(filename)),
+                ('Cache-Control', 'no-store'),
+            ],
+            direct_passthrough=True,
+        )
+
+    # ============================================
+    # ENDPOINTS - Lotes
+    # ============================================
+
+    def _get_batch_operations(self):
+        """
+        Operaciones disponibles en /api/biometric/batch
+        
+        Solo operaciones que trabajan sobre el cursor de la petición, para que el
+        savepoint de cada una pueda revertirla. Quedan fuera ``sync`` (lee en su
+        propio cursor y no vería lo escrito por las operaciones anteriores) y
+        ``destroy_session`` (borra la sesión del almacén de sesiones, fuera de la
+        base). Lo único que un savepoint no deshace es inocuo: la marca de lectura
+        en el primario de la sesión HTTP y el aviso a los crons (``_trigger``), que
+        a lo sumo adelantan una ejecución sin trabajo.
+        
+        Returns:
+            dict: nombre → callable(**params) que devuelve el mismo resultado
+                  que el endpoint o método individual
+        """
+        BiometricDevice = request.env['biometric.device']
+        AuthLog = request.env['biometric.auth.log']
+        return {
+            # Endpoints REST de este controlador
+            'register_device': self.register_device,
+            'get_devices': self.get_devices,
+            'get_device': self.get_device,
+            'revoke_device': self.revoke_device,
+            'activate_device': self.activate_device,
+            'log_authentication': self.log_authentication,
+            'get_auth_history': self.get_auth_history,
+            'get_device_stats': self.get_device_stats,
+            'get_devices_stats': self.get_devices_stats,
+            'get_user_summary': self.get_user_summary,
+            'identify_current_device': self.identify_current_device,
+            'bootstrap': self.bootstrap,
+            'get_dashboard': self.get_dashboard,
+            # Métodos de modelo usados por la app vía JSON-RPC
+            'validate_device': BiometricDevice.validate_device,
+            'reactivate_device': BiometricDevice.reactivate_device,
+            'get_active_sessions': AuthLog.get_active_sessions,
+            'log_traditional_login': AuthLog.log_traditional_login,
+            'end_session': AuthLog.end_session,
+        }
+
+    @http.route('/api/biometric/batch', 
+                type='json', 
+                auth='user', 
+                methods=['POST'], 
+                csrf=False)
+    def batch(self, calls=None, **kwargs):
+        """
+        Ejecuta varias operaciones biométricas en orden, en una sola transacción
+        
+        Cada operación corre en su propio savepoint: si falla (excepción o
+        "success": false) se revierten solo sus cambios y el resto continúa.
+        
+        POST /api/biometric/batch
+        Body: {
+            "calls": [
+                {"id": "any", "method": "revoke_device", "params": {"device_id": 12}},
+                {"id": "any", "method": "get_devices", "params": {}}
+            ]
+        }
+        
+        Returns: {
+            "success": true,
+            "results": [
+                {"id": "any", "success": bool, "result": {...}, "error": "string"}
+            ]
+        }
+        """
+        if not isinstance(calls, list):
+            return {
+                'success': False,
+                'error': 'calls debe ser una lista de {method, params}'
+            }
+
+        if len(calls) > BATCH_MAX_ITEMS:
+            return {
+                'success': False,
+                'error': f'Máximo {BATCH_MAX_ITEMS} operaciones por lote'
+            }
+
+        operations = self._get_batch_operations()
+        results = []
+
+        for call in calls:
+            call = call if isinstance(call, dict) else {}
+            item = {'id': call.get('id'), 'method': call.get('method')}
+            operation = operations.get(call.get('method'))
+            params = call.get('params') or {}
+
+            if not operation or not isinstance(params, dict):
+                item.update(success=False, error='Método no soportado o parámetros inválidos')
+                results.append(item)
+                continue
+
+            savepoint = request.env.cr.savepoint()
+            try:
+                result = operation(**params)
+            except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+                raise  # Odoo reintenta la petición completa
+            except Exception as e:
+                _logger.error(f'Error en lote ({item["method"]}): {str(e)}')
+                savepoint.close(rollback=True)
+                request.env.invalidate_all(flush=False)
+                item.update(success=False, error=str(e))
+                results.append(item)
+                continue
+
+            failed = isinstance(result, dict) and result.get('success') is False
+            savepoint.close(rollback=failed)
+            if failed:
+                request.env.invalidate_all(flush=False)
+                item.update(success=False, result=result, error=result.get('error') or result.get('message'))
+            else:
+                item.update(success=True, result=result)
+            results.append(item)
+
+        return {
+            'success': True,
+            'results': results
+        }
+
     # ============================================
     # ENDPOINTS - Utilitarios
     # ============================================
@@ -455,13 +966,14 @@ class BiometricAPIController(http.Controller):
                 auth='user', 
                 methods=['POST'], 
                 csrf=False)
-    def identify_current_device(self, device_id, **kwargs):
+    def identify_current_device(self, device_id, fields=None, **kwargs):
         """
         Identifica y actualiza el dispositivo actual
         
         POST /api/biometric/devices/current
         Body: {
-            "device_id": "string"
+            "device_id": "string",
+            "fields": ["deviceName", "state"]  (opcional)
         }
         
         Returns: {
@@ -493,9 +1005,11 @@ class BiometricAPIController(http.Controller):
 
             return {
                 'success': True,
-                'device': device._format_device_data()
+                'device': device._format_device_data(fields)
             }
 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error identificando dispositivo: {str(e)}')
             return {
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from odoo import http
+from odoo.http import request
+from odoo.addons.web.controllers.dataset import DataSet
+from odoo.addons.biometric_management import replica
+
+
+def _call_kw_readonly(controller):
+    """
+    Métodos ``@api.readonly`` de modelos biométricos: réplica salvo justo después
+    de escrituras del propio usuario. El resto de modelos conserva el criterio de Odoo.
+    """
+    readonly = controller._call_kw_readonly()
+    model = request.get_json_data()['params'].get('model') or ''
+    if readonly and model.startswith('biometric.'):
+        return replica.replica_allowed()
+    return readonly
+
+
+class BiometricDataSet(DataSet):
+
+    @http.route(readonly=_call_kw_readonly)
+    def call_kw(self, model, method, args, kwargs, path=None):
+        return super().call_kw(model, method, args, kwargs, path=path)
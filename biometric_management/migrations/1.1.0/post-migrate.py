@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Completa las migraciones de datos legados durante la actualización del módulo, de
+modo que al arrancar la nueva versión no haya filas sin migrar. Los crons de
+respaldo solo recogen lo que quede y se desactivan solos.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    
+    # device_info_json (texto) → device_info (JSONB) y columnas extraídas
+    env['biometric.device']._backfill_device_info(commit=False)
+    
+    # Textos de error/dispositivo de los logs → catálogos
+    env['biometric.auth.log']._backfill_lookups(commit=False)
+    
+    # Nombre almacenado de los logs anteriores
+    env['biometric.auth.log']._backfill_names(commit=False)
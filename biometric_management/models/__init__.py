@@ -1,2 +1,13 @@
 from . import biometric_device
-from . import biometric_auth_log
\ No newline at end of file
+from . import biometric_device_tombstone
+from . import biometric_auth_error
+from . import biometric_device_snapshot
+from . import biometric_auth_log
+from . import biometric_auth_stats_daily
+from . import biometric_dashboard
+from . import biometric_job
+from . import biometric_user_summary
+from . import biometric_idempotency_key
+from . import biometric_erasure_request
+from . import res_users
+from . import hr_employee
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.tools import create_unique_index
+import hashlib
+
+
+def lookup_fingerprint(*values):
+    """Huella de una combinación de textos (misma fórmula que en SQL: md5 con separador 0x1f)"""
+    return hashlib.md5('\x1f'.join(value or '' for value in values).encode()).hexdigest()
+
+
+# Expresión SQL equivalente a lookup_fingerprint para dos columnas
+SQL_FINGERPRINT = "md5(COALESCE({0}, '') || chr(31) || COALESCE({1}, ''))"
+
+
+class BiometricAuthError(models.Model):
+    _name = 'biometric.auth.error'
+    _description = 'Catálogo de Errores de Autenticación'
+    _order = 'code, id'
+    _rec_name = 'code'
+
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    code = fields.Char(
+        string='Código Error',
+        readonly=True
+    )
+    
+    message = fields.Text(
+        string='Mensaje Error',
+        readonly=True
+    )
+    
+    fingerprint = fields.Char(
+        string='Huella',
+        required=True,
+        readonly=True,
+        help='md5 de código y mensaje: una fila por combinación distinta'
+    )
+    
+    def init(self):
+        create_unique_index(
+            self._cr,
+            'biometric_auth_error_fingerprint_idx',
+            self._table,
+            ['fingerprint'],
+        )
+    
+    @api.model
+    def _get_error_id(self, code, message):
+        """
+        ID del catálogo para (código, mensaje), creándolo si no existe.
+        
+        Returns:
+            int|bool: ID del error (False si no hay código ni mensaje)
+        """
+        if not code and not message:
+            return False
+        fingerprint = lookup_fingerprint(code, message)
+        cr = self.env.cr
+        cr.execute('SELECT id FROM biometric_auth_error WHERE fingerprint = %s', (fingerprint,))
+        row = cr.fetchone()
+        if not row:
+            cr.execute("""
+                INSERT INTO biometric_auth_error
+                    (code, message, fingerprint, create_uid, create_date, write_uid, write_date)
+                VALUES (%(code)s, %(message)s, %(fingerprint)s,
+                        %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC')
+                ON CONFLICT (fingerprint) DO NOTHING
+                RETURNING id
+            """, {'code': code or None, 'message': message or None, 'fingerprint': fingerprint, 'uid': self.env.uid})
+            row = cr.fetchone()
+            if not row:
+                cr.execute('SELECT id FROM biometric_auth_error WHERE fingerprint = %s', (fingerprint,))
+                row = cr.fetchone()
+        return row[0]
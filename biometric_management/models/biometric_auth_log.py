@@ -1,17 +1,68 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
 from odoo.http import root
+from odoo.tools import create_index, column_exists
+from odoo.service.model import PG_CONCURRENCY_EXCEPTIONS_TO_RETRY
+from odoo.addons.biometric_management import replica
+from .biometric_auth_error import SQL_FINGERPRINT
+from psycopg2.errors import LockNotAvailable, SerializationFailure
 import requests
 import logging
+import uuid
+from datetime import timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Exportación: filas por lote leídas del cursor del servidor
+EXPORT_BATCH_SIZE = 5000
+
+# Notificaciones del bus (websocket) hacia la app del usuario afectado
+BUS_SESSION_ENDED = 'biometric/session_ended'
+BUS_SESSION_DESTROYED = 'biometric/session_destroyed'
+
+# Columnas de la exportación (orden de salida)
+EXPORT_COLUMNS = [
+    'id', 'auth_date', 'user_id', 'user_login', 'device_id', 'device_name',
+    'device_platform', 'auth_type', 'success', 'error_code', 'error_message',
+    'ip_address', 'duration_ms', 'session_active', 'session_ended_at',
+    'occurrence_count', 'last_occurrence_at',
+]
+
+# Ventana por defecto (segundos) para agrupar fallos idénticos consecutivos
+DEFAULT_FAILURE_FOLD_SECONDS = 60
+# Duración máxima (segundos) de una ráfaga agrupada en un mismo log, medida desde auth_date
+FAILURE_FOLD_MAX_SPAN_SECONDS = 900
+# Filas por lote (y por commit) al migrar los textos legados a los catálogos
+LOOKUP_BACKFILL_BATCH = 5000
+# Campos de los que depende la consolidación diaria (biometric.auth.stats.daily)
+STATS_FIELDS = {'auth_date', 'user_id', 'device_id', 'device_snapshot_id', 'auth_type',
+                'success', 'duration_ms', 'occurrence_count'}
+# Columnas de texto legadas reemplazadas por error_id / device_snapshot_id
+LEGACY_LOOKUP_COLUMNS = ('error_code', 'error_message', 'device_name_direct', 'device_platform_direct')
+# Copias almacenadas legadas de nombre/plataforma (ahora se leen del dispositivo o snapshot)
+LEGACY_DEVICE_COLUMNS = ('device_name', 'device_platform')
+
+# Nombre y plataforma mostrados de un log (alias l, dispositivo d, snapshot s),
+# mismo criterio que _compute_device_info
+SQL_LOG_DEVICE_NAME = "CASE WHEN l.device_id IS NOT NULL THEN COALESCE(d.device_name, 'Dispositivo') ELSE COALESCE(s.name, 'Sin dispositivo') END"
+SQL_LOG_DEVICE_PLATFORM = "COALESCE(CASE WHEN l.device_id IS NOT NULL THEN d.platform ELSE s.platform END, 'unknown')"
+# Nombre almacenado de un log (alias l), mismo formato que _make_name
+SQL_LOG_NAME = """
+    COALESCE((
+        SELECT p.name FROM res_users u
+        JOIN res_partner p ON p.id = u.partner_id
+        WHERE u.id = l.user_id
+    ), '') || ' - '
+    || CASE WHEN l.success THEN 'Exitoso' ELSE 'Fallido' END || ' - '
+    || to_char(l.auth_date, 'YYYY-MM-DD HH24:MI:SS')
+"""
+
 
 class BiometricAuthLog(models.Model):
     _name = 'biometric.auth.log'
     _description = 'Log de Autenticaciones Biométricas'
     _order = 'auth_date desc'
-    _rec_name = 'display_name'
+    _rec_name = 'name'
 
     # ============================================
     # CAMPOS BÁSICOS
@@ -76,13 +127,23 @@ class BiometricAuthLog(models.Model):
     # INFORMACIÓN DEL INTENTO
     # ============================================
     
+    # Código y mensaje viven en un catálogo (biometric.auth.error): cada log solo
+    # guarda el ID en lugar de repetir los mismos textos en millones de filas
+    error_id = fields.Many2one(
+        'biometric.auth.error',
+        string='Error',
+        ondelete='restrict'
+    )
+    
     error_code = fields.Char(
         string='Código Error',
+        related='error_id.code',
         help='Código de error si falló'
     )
     
     error_message = fields.Text(
         string='Mensaje Error',
+        related='error_id.message',
         help='Mensaje de error si falló'
     )
     
@@ -115,38 +176,151 @@ class BiometricAuthLog(models.Model):
         help='Notas adicionales sobre el intento'
     )
     
+    # ============================================
+    # RÁFAGAS DE FALLOS
+    # ============================================
+    
+    occurrence_count = fields.Integer(
+        string='Ocurrencias',
+        default=1,
+        help='Intentos representados por este registro (fallos idénticos consecutivos agrupados)'
+    )
+    
+    last_occurrence_at = fields.Datetime(
+        string='Última Ocurrencia',
+        help='Fecha/hora del último intento agrupado (la primera es la fecha del registro)'
+    )
+    
     # ============================================
     # CAMPOS COMPUTADOS
     # ============================================
     
-    display_name = fields.Char(
+    # Nombre descriptivo almacenado al crear el log (usuario - resultado - fecha):
+    # listas, many2one y exportaciones lo leen sin recalcular, y el índice
+    # trigram permite buscar por nombre sin recorrer la tabla
+    name = fields.Char(
         string='Nombre',
-        compute='_compute_display_name'
+        readonly=True,
+        index='trigram'
+    )
+    
+    # Campos de dispositivo - pueden venir del device_id o ser directos.
+    # La copia directa (nombre, plataforma) se guarda una sola vez en biometric.device.snapshot
+    device_snapshot_id = fields.Many2one(
+        'biometric.device.snapshot',
+        string='Datos del Dispositivo',
+        ondelete='restrict'
     )
     
-    # Campos de dispositivo - pueden venir del device_id o ser directos
     device_name_direct = fields.Char(
         string='Nombre Dispositivo Directo',
+        related='device_snapshot_id.name',
         help='Nombre del dispositivo cuando no hay device_id'
     )
     
     device_platform_direct = fields.Char(
         string='Plataforma Directa',
+        related='device_snapshot_id.platform',
         help='Plataforma cuando no hay device_id'
     )
     
+    # No almacenados: se leen del dispositivo (o del snapshot) al consultar, así
+    # renombrar un dispositivo no obliga a recalcular todos sus logs
     device_name = fields.Char(
         string='Nombre Dispositivo',
         compute='_compute_device_info',
-        store=True
+        search='_search_device_name'
     )
     
     device_platform = fields.Char(
         string='Plataforma',
         compute='_compute_device_info',
-        store=True
+        search='_search_device_platform'
     )
     
+    def init(self):
+        # Índice para la sincronización delta (keyset sobre write_date, id por usuario)
+        create_index(
+            self._cr,
+            'biometric_auth_log_user_write_date_idx',
+            self._table,
+            ['user_id', 'write_date', 'id'],
+        )
+        # Último log de un dispositivo (agrupación de ráfagas de fallos)
+        create_index(
+            self._cr,
+            'biometric_auth_log_device_auth_date_idx',
+            self._table,
+            ['device_id', 'auth_date DESC', 'id DESC'],
+        )
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Traduce los textos a sus catálogos y fija el nombre descriptivo"""
+        user_names = self._get_user_names({vals.get('user_id') for vals in vals_list})
+        now = fields.Datetime.now()
+        for vals in vals_list:
+            self._encode_lookup_vals(vals)
+            vals.setdefault('auth_date', now)
+            if not vals.get('name'):
+                vals['name'] = self._make_name(
+                    user_names.get(vals.get('user_id')),
+                    fields.Datetime.to_datetime(vals['auth_date']),
+                    vals.get('success', True),
+                )
+        logs = super(BiometricAuthLog, self).create(vals_list)
+        # Logs con fecha de un día ya consolidado (los del día en curso no anotan nada)
+        self.env['biometric.auth.stats.daily'].sudo()._mark_dirty_days(
+            log.auth_date.date() for log in logs
+        )
+        return logs
+    
+    def write(self, vals):
+        """Traduce los textos a sus catálogos y mantiene el nombre descriptivo"""
+        self._encode_lookup_vals(vals)
+        previous_user_ids = set(self.user_id.ids)
+        stats_changed = bool(STATS_FIELDS & set(vals))
+        previous_days = {log.auth_date.date() for log in self} if stats_changed else set()
+        result = super(BiometricAuthLog, self).write(vals)
+        if stats_changed:
+            self.env['biometric.auth.stats.daily'].sudo()._mark_dirty_days(
+                previous_days | {log.auth_date.date() for log in self}
+            )
+        if {'user_id', 'auth_date', 'success'} & set(vals):
+            # Un único UPDATE para todo el lote (no uno por registro)
+            self.flush_recordset(['user_id', 'auth_date', 'success'])
+            self.env.cr.execute(f"""
+                UPDATE biometric_auth_log l SET name = {SQL_LOG_NAME}
+                WHERE l.id = ANY(%s)
+            """, (self.ids,))
+            self.invalidate_recordset(['name'])
+        if {'user_id', 'device_id', 'success', 'session_active'} & set(vals):
+            # authCount / hasActiveSession de los dispositivos cambian: invalida su caché
+            self.env['biometric.user.summary'].sudo()._touch(previous_user_ids | set(self.user_id.ids))
+        return result
+    
+    def unlink(self):
+        """Invalida la caché de payloads y anota los días consolidados afectados"""
+        user_ids = set(self.user_id.ids)
+        days = {log.auth_date.date() for log in self}
+        result = super(BiometricAuthLog, self).unlink()
+        self.env['biometric.auth.stats.daily'].sudo()._mark_dirty_days(days)
+        self.env['biometric.user.summary'].sudo()._touch(user_ids)
+        return result
+    
+    @api.model
+    def _encode_lookup_vals(self, vals):
+        """Reemplaza en ``vals`` los textos por los IDs de los catálogos (in situ)"""
+        if 'error_code' in vals or 'error_message' in vals:
+            vals['error_id'] = self.env['biometric.auth.error']._get_error_id(
+                vals.pop('error_code', None), vals.pop('error_message', None),
+            )
+        if 'device_name_direct' in vals or 'device_platform_direct' in vals:
+            vals['device_snapshot_id'] = self.env['biometric.device.snapshot']._get_snapshot_id(
+                vals.pop('device_name_direct', None), vals.pop('device_platform_direct', None),
+            )
+        return vals
+    
     @api.depends('device_id', 'device_id.device_name', 'device_id.platform', 'device_name_direct', 'device_platform_direct')
     def _compute_device_info(self):
         """Computa nombre y plataforma desde device_id o campos directos"""
@@ -158,20 +332,48 @@ class BiometricAuthLog(models.Model):
                 record.device_name = record.device_name_direct or 'Sin dispositivo'
                 record.device_platform = record.device_platform_direct or 'unknown'
     
-    @api.depends('user_id', 'auth_date', 'success')
-    def _compute_display_name(self):
+    def _search_device_name(self, operator, value):
+        return ['|',
+                ('device_id.device_name', operator, value),
+                '&', ('device_id', '=', False), ('device_snapshot_id.name', operator, value)]
+    
+    def _search_device_platform(self, operator, value):
+        return ['|',
+                ('device_id.platform', operator, value),
+                '&', ('device_id', '=', False), ('device_snapshot_id.platform', operator, value)]
+    
+    @api.model
+    def _make_name(self, user_name, auth_date, success):
         """Genera nombre descriptivo para el log"""
-        for record in self:
-            status = 'Exitoso' if record.success else 'Fallido'
-            date_str = fields.Datetime.to_string(record.auth_date)
-            record.display_name = f'{record.user_id.name} - {status} - {date_str}'
+        status = 'Exitoso' if success else 'Fallido'
+        date_str = fields.Datetime.to_string(auth_date)
+        return f'{user_name} - {status} - {date_str}'
+    
+    @api.model
+    def _get_user_names(self, user_ids):
+        """Nombres de usuario en una sola lectura: {user_id: name}"""
+        users = self.env['res.users'].sudo().browse([uid for uid in user_ids if uid])
+        return {user.id: user.name for user in users}
+    
+    def _bus_notify(self, notification_type):
+        """Publica el fin de estas sesiones en el canal del bus de cada usuario"""
+        self.env['bus.bus'].sudo()._sendmany([
+            (log.user_id.partner_id, notification_type, {
+                'sessionId': log.session_id,
+                'deviceId': log.device_id.device_id or None,
+                'deviceOdooId': log.device_id.id or None,
+                'logId': log.id,
+            })
+            for log in self
+        ])
     
     # ============================================
     # MÉTODOS API
     # ============================================
     
     @api.model
-    def log_authentication(self, device_id, success=True, error_info=None, session_id=None, duration_ms=None):
+    def log_authentication(self, device_id, success=True, error_info=None, session_id=None, duration_ms=None,
+                           idempotency_key=None):
         """
         Registra un intento de autenticación
         
@@ -181,10 +383,20 @@ class BiometricAuthLog(models.Model):
             error_info (dict): Información del error si falló
             session_id (str): ID de sesión si fue exitoso
             duration_ms (int): Duración de la autenticación en milisegundos
+            idempotency_key (str): Clave de la app; un reintento con la misma clave
+                devuelve el resultado original sin crear otro log
             
         Returns:
             dict: Log creado
         """
+        return self.env['biometric.idempotency.key']._run_once(
+            'log_authentication', idempotency_key,
+            lambda: self._log_authentication(device_id, success, error_info, session_id, duration_ms),
+        )
+    
+    @api.model
+    def _log_authentication(self, device_id, success=True, error_info=None, session_id=None, duration_ms=None):
+        """Registro efectivo del intento (ver log_authentication)"""
         try:
             device = self.env['biometric.device'].browse(device_id)
             
@@ -215,13 +427,29 @@ class BiometricAuthLog(models.Model):
                     'error_message': error_info.get('message'),
                 })
             
+            # Textos → IDs de catálogo (también usados para comparar fallos idénticos)
+            self._encode_lookup_vals(log_data)
+            
+            # Fallo idéntico al anterior del dispositivo: se suma a ese registro
+            log = None
+            if not success:
+                log = self._fold_failure(device, log_data)
+            
             # Crear log (con sudo para evitar restricciones de acceso)
-            log = self.sudo().create(log_data)
+            if not log:
+                log = self.sudo().create(log_data)
             
             # Si fue exitoso, actualizar dispositivo
             if success:
                 device.update_last_used()
             
+            # Resumen por usuario: último acceso/fallo, racha de fallos y sesiones
+            # Hora de este intento (un fallo agrupado conserva el auth_date de la ráfaga)
+            self.env['biometric.user.summary'].sudo()._record_auth(
+                self.env.user.id, success, log_data['auth_date'], opens_session=success,
+            )
+            replica.mark_user_write()
+            
             _logger.info(
                 f'Autenticación {"exitosa" if success else "fallida"} '
                 f'para usuario {self.env.user.name} en dispositivo {device.device_name}'
@@ -230,9 +458,12 @@ class BiometricAuthLog(models.Model):
             return {
                 'id': log.id,
                 'success': True,
+                'occurrences': log.occurrence_count,
                 'message': 'Log registrado correctamente'
             }
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error registrando autenticación: {str(e)}')
             return {
@@ -241,7 +472,80 @@ class BiometricAuthLog(models.Model):
             }
     
     @api.model
-    def get_user_auth_history(self, user_id=None, limit=20, offset=0):
+    def _get_failure_fold_seconds(self):
+        """Ventana para agrupar fallos idénticos consecutivos (0 = no agrupar)"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'biometric.auth.failure.fold.seconds', DEFAULT_FAILURE_FOLD_SECONDS
+        ))
+    
+    @api.model
+    def _fold_failure(self, device, log_data):
+        """
+        Suma un intento fallido al último log del dispositivo si es un fallo idéntico
+        (mismo usuario, código y mensaje) ocurrido dentro de la ventana.
+        
+        La ráfaga se acota: el log agrupado debe ser del mismo día UTC (las
+        estadísticas diarias lo cuentan en su auth_date) y no haber empezado hace
+        más de FAILURE_FOLD_MAX_SPAN_SECONDS, aunque los fallos sigan llegando.
+        
+        El último log se bloquea con FOR UPDATE NOWAIT dentro de un savepoint: si
+        otra transacción lo tiene bloqueado o ya lo modificó (error de serialización
+        en REPEATABLE READ), no se agrupa y el llamador inserta un log nuevo, de
+        modo que el fallo nunca se pierde.
+        
+        Returns:
+            biometric.auth.log: Log agrupado, o vacío si hay que crear uno nuevo
+        """
+        window = self._get_failure_fold_seconds()
+        if window <= 0:
+            return self.browse()
+        
+        now = log_data['auth_date']
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute("""
+                    UPDATE biometric_auth_log
+                    SET occurrence_count = COALESCE(occurrence_count, 1) + 1,
+                        last_occurrence_at = %(now)s,
+                        write_uid = %(uid)s,
+                        write_date = now() AT TIME ZONE 'UTC'
+                    WHERE id = (
+                        SELECT id FROM biometric_auth_log
+                        WHERE device_id = %(device_id)s
+                        ORDER BY auth_date DESC, id DESC
+                        LIMIT 1
+                        FOR UPDATE NOWAIT
+                    )
+                      AND user_id = %(user_id)s
+                      AND NOT success
+                      AND auth_type = 'biometric'
+                      AND error_id IS NOT DISTINCT FROM %(error_id)s
+                      AND COALESCE(last_occurrence_at, auth_date) >= %(since)s
+                      AND auth_date >= %(burst_start)s
+                    RETURNING id
+                """, {
+                    'now': now,
+                    'uid': self.env.uid,
+                    'device_id': device.id,
+                    'user_id': log_data['user_id'],
+                    'error_id': log_data.get('error_id') or None,
+                    'since': now - timedelta(seconds=window),
+                    'burst_start': max(day_start, now - timedelta(seconds=FAILURE_FOLD_MAX_SPAN_SECONDS)),
+                }, log_exceptions=False)
+                row = self.env.cr.fetchone()
+        except (LockNotAvailable, SerializationFailure):
+            _logger.debug(f'Log en uso para el dispositivo {device.id}; se registra el fallo aparte')
+            return self.browse()
+        if not row:
+            return self.browse()
+        log = self.sudo().browse(row[0])
+        log.invalidate_recordset(['occurrence_count', 'last_occurrence_at', 'write_uid', 'write_date'])
+        return log
+    
+    @api.model
+    @api.readonly
+    def get_user_auth_history(self, user_id=None, limit=20, offset=0, requested_fields=None):
         """
         Obtiene el historial de autenticaciones de un usuario con paginación
         
@@ -249,12 +553,11 @@ class BiometricAuthLog(models.Model):
             user_id (int): ID del usuario (None = usuario actual)
             limit (int): Límite de registros por página
             offset (int): Desplazamiento para paginación
+            requested_fields (list|str): Claves a devolver por registro (None = todas)
             
         Returns:
             dict: Historial formateado con información de paginación
         """
-        from datetime import timedelta
-        
         if user_id is None:
             user_id = self.env.user.id
         
@@ -266,6 +569,26 @@ class BiometricAuthLog(models.Model):
         # Obtener logs con paginación
         logs = self.search(domain, order='auth_date desc', limit=limit, offset=offset)
         
+        return {
+            'records': logs._format_history_data(requested_fields),
+            'total': total_count,
+            'limit': limit,
+            'offset': offset,
+            'has_more': (offset + limit) < total_count,
+        }
+    
+    def _format_history_data(self, requested_fields=None):
+        """
+        Formatea los logs para la API de historial
+        
+        Args:
+            requested_fields (list|str): Claves a devolver (None = todas). ``id`` siempre se incluye.
+            
+        Returns:
+            list: Registros formateados
+        """
+        requested_fields = self.env['biometric.device']._parse_requested_fields(requested_fields)
+        
         # Venezuela timezone offset (UTC-4)
         tz_offset = timedelta(hours=-4)
         
@@ -277,35 +600,281 @@ class BiometricAuthLog(models.Model):
             local_dt = dt + tz_offset
             return local_dt.strftime('%Y-%m-%dT%H:%M:%S')
         
-        records = [{
-            'id': log.id,
-            'device_name': log.device_name or 'Sin dispositivo',
-            'device_platform': log.device_platform or 'unknown',
-            'device_name_direct': log.device_name_direct,
-            'device_platform_direct': log.device_platform_direct,
-            'auth_date': format_datetime_venezuela(log.auth_date),
-            'success': log.success,
-            'auth_type': log.auth_type,
-            'session_active': log.session_active,
-            'session_ended_at': format_datetime_venezuela(log.session_ended_at),
-            'error_code': log.error_code,
-            'error_message': log.error_message,
-            'ip_address': log.ip_address,
-            'user_agent': log.user_agent,
-            'duration_ms': log.duration_ms,
-            'notes': log.notes,
-            'session_id': log.session_id,
-        } for log in logs]
-        
-        return {
-            'records': records,
-            'total': total_count,
-            'limit': limit,
-            'offset': offset,
-            'has_more': (offset + limit) < total_count,
+        getters = {
+            'device_name': lambda log: log.device_name or 'Sin dispositivo',
+            'device_platform': lambda log: log.device_platform or 'unknown',
+            'device_name_direct': lambda log: log.device_name_direct,
+            'device_platform_direct': lambda log: log.device_platform_direct,
+            'auth_date': lambda log: format_datetime_venezuela(log.auth_date),
+            'success': lambda log: log.success,
+            'auth_type': lambda log: log.auth_type,
+            'session_active': lambda log: log.session_active,
+            'session_ended_at': lambda log: format_datetime_venezuela(log.session_ended_at),
+            'error_code': lambda log: log.error_code,
+            'error_message': lambda log: log.error_message,
+            'ip_address': lambda log: log.ip_address,
+            'user_agent': lambda log: log.user_agent,
+            'duration_ms': lambda log: log.duration_ms,
+            'occurrence_count': lambda log: log.occurrence_count or 1,
+            'last_occurrence_at': lambda log: format_datetime_venezuela(log.last_occurrence_at or log.auth_date),
+            'notes': lambda log: log.notes,
+            'session_id': lambda log: log.session_id,
         }
+        if requested_fields is not None:
+            getters = {key: getter for key, getter in getters.items() if key in requested_fields}
+        
+        records = []
+        for log in self:
+            record = {'id': log.id}
+            for key, getter in getters.items():
+                record[key] = getter(log)
+            records.append(record)
+        return records
+    
+    @api.model
+    def _iter_export_rows(self, date_from=None, date_to=None, user_id=None, device_id=None,
+                          success=None, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Recorre los logs con un cursor del lado del servidor y los entrega por lotes.
+        
+        La memoria usada es constante sin importar el tamaño del rango: PostgreSQL
+        materializa solo ``batch_size`` filas por vez. Lee directamente por SQL, por lo
+        que el llamador debe verificar que el usuario es administrador.
+        
+        Args:
+            date_from (datetime): Fecha/hora mínima (incluida)
+            date_to (datetime): Fecha/hora máxima (excluida)
+            user_id (int): Filtrar por usuario
+            device_id (int): Filtrar por dispositivo
+            success (bool): Filtrar por resultado
+            batch_size (int): Filas por lote
+            
+        Yields:
+            list: Tuplas en el orden de EXPORT_COLUMNS
+        """
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append('l.auth_date >= %s')
+            params.append(date_from)
+        if date_to:
+            conditions.append('l.auth_date < %s')
+            params.append(date_to)
+        if user_id:
+            conditions.append('l.user_id = %s')
+            params.append(user_id)
+        if device_id:
+            conditions.append('l.device_id = %s')
+            params.append(device_id)
+        if success is not None:
+            conditions.append('l.success = %s')
+            params.append(bool(success))
+        where = ' AND '.join(conditions) or 'TRUE'
+        
+        query = f"""
+            SELECT l.id, l.auth_date, l.user_id, u.login, l.device_id, {SQL_LOG_DEVICE_NAME},
+                   {SQL_LOG_DEVICE_PLATFORM}, l.auth_type, l.success, e.code, e.message,
+                   l.ip_address, l.duration_ms, l.session_active, l.session_ended_at,
+                   COALESCE(l.occurrence_count, 1), COALESCE(l.last_occurrence_at, l.auth_date)
+            FROM biometric_auth_log l
+            JOIN res_users u ON u.id = l.user_id
+            LEFT JOIN biometric_auth_error e ON e.id = l.error_id
+            LEFT JOIN biometric_device d ON d.id = l.device_id
+            LEFT JOIN biometric_device_snapshot s ON s.id = l.device_snapshot_id
+            WHERE {where}
+            ORDER BY l.id
+        """
+        
+        self.flush_model()
+        # Cursor con nombre = cursor del lado del servidor (psycopg2)
+        with self.env.cr._cnx.cursor(name=f'biometric_export_{uuid.uuid4().hex}') as server_cursor:
+            server_cursor.itersize = batch_size
+            server_cursor.execute(query, params)
+            while True:
+                rows = server_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+    
+    @api.model
+    def _cron_backfill_lookups(self, batch_size=LOOKUP_BACKFILL_BATCH):
+        """
+        Cron de respaldo de la migración (la hace migrations/1.1.0/post-migrate.py):
+        completa lo que quede y se desactiva cuando ya no hay columnas legadas.
+        """
+        migrated = self._backfill_lookups(batch_size)
+        cr = self.env.cr
+        if not any(column_exists(cr, self._table, column)
+                   for column in LEGACY_LOOKUP_COLUMNS + LEGACY_DEVICE_COLUMNS):
+            self.env['ir.cron']._notify_progress(done=migrated, remaining=0, deactivate=True)
     
     @api.model
+    def _backfill_lookups(self, batch_size=LOOKUP_BACKFILL_BATCH, commit=True):
+        """
+        Migra por lotes los textos legados (error_code, error_message,
+        device_name_direct, device_platform_direct) a los catálogos, vacía las
+        copias almacenadas de device_name / device_platform y elimina esas columnas
+        al terminar.
+        
+        Cada lote se recorre por id (keyset): se insertan en bloque las combinaciones
+        nuevas, se asignan los IDs con un único UPDATE y se vacían las columnas de
+        texto, por lo que el proceso es reanudable (commit=False en la migración).
+        
+        Returns:
+            int: Logs migrados
+        """
+        cr = self.env.cr
+        legacy_columns = tuple(
+            column for column in LEGACY_LOOKUP_COLUMNS + LEGACY_DEVICE_COLUMNS
+            if column_exists(cr, self._table, column)
+        )
+        if not legacy_columns:
+            return 0
+        if not set(LEGACY_LOOKUP_COLUMNS) <= set(legacy_columns):
+            # Sin los textos no hay nada que migrar: solo quedan columnas sobrantes
+            self._drop_legacy_columns(legacy_columns)
+            return 0
+        
+        pending = ' OR '.join(f'{column} IS NOT NULL' for column in legacy_columns)
+        pending_l = ' OR '.join(f'l.{column} IS NOT NULL' for column in legacy_columns)
+        error_fp = SQL_FINGERPRINT.format('l.error_code', 'l.error_message')
+        snapshot_fp = SQL_FINGERPRINT.format('l.device_name_direct', 'l.device_platform_direct')
+        params = {'uid': self.env.uid}
+        last_id = 0
+        migrated = 0
+        while True:
+            cr.execute(f"""
+                SELECT max(id), count(*) FROM (
+                    SELECT id FROM biometric_auth_log
+                    WHERE id > %s AND ({pending})
+                    ORDER BY id
+                    LIMIT %s
+                ) batch
+            """, (last_id, batch_size))
+            batch_end, count = cr.fetchone()
+            if not count:
+                break
+            params.update(first=last_id, last=batch_end)
+            batch = f'l.id > %(first)s AND l.id <= %(last)s AND ({pending_l})'
+            
+            cr.execute(f"""
+                INSERT INTO biometric_auth_error
+                    (code, message, fingerprint, create_uid, create_date, write_uid, write_date)
+                SELECT DISTINCT ON ({error_fp}) l.error_code, l.error_message, {error_fp},
+                       %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM biometric_auth_log l
+                WHERE {batch} AND (l.error_code IS NOT NULL OR l.error_message IS NOT NULL)
+                ON CONFLICT (fingerprint) DO NOTHING
+            """, params)
+            cr.execute(f"""
+                INSERT INTO biometric_device_snapshot
+                    (name, platform, fingerprint, create_uid, create_date, write_uid, write_date)
+                SELECT DISTINCT ON ({snapshot_fp}) l.device_name_direct, l.device_platform_direct, {snapshot_fp},
+                       %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM biometric_auth_log l
+                WHERE {batch} AND (l.device_name_direct IS NOT NULL OR l.device_platform_direct IS NOT NULL)
+                ON CONFLICT (fingerprint) DO NOTHING
+            """, params)
+            cr.execute(f"""
+                UPDATE biometric_auth_log l
+                SET error_id = COALESCE(l.error_id, e.id),
+                    device_snapshot_id = COALESCE(l.device_snapshot_id, s.id),
+                    {', '.join(f'{column} = NULL' for column in legacy_columns)}
+                FROM biometric_auth_log src
+                LEFT JOIN biometric_auth_error e
+                    ON (src.error_code IS NOT NULL OR src.error_message IS NOT NULL)
+                   AND e.fingerprint = {SQL_FINGERPRINT.format('src.error_code', 'src.error_message')}
+                LEFT JOIN biometric_device_snapshot s
+                    ON (src.device_name_direct IS NOT NULL OR src.device_platform_direct IS NOT NULL)
+                   AND s.fingerprint = {SQL_FINGERPRINT.format('src.device_name_direct', 'src.device_platform_direct')}
+                WHERE src.id = l.id AND {batch}
+            """, params)
+            
+            last_id = batch_end
+            migrated += count
+            if commit:
+                cr.commit()
+        
+        if migrated:
+            self.invalidate_model()
+            _logger.info(f'Logs migrados a catálogos de error/dispositivo: {migrated}')
+        self._drop_legacy_columns(legacy_columns)
+        return migrated
+    
+    @api.model
+    def _drop_legacy_columns(self, columns):
+        """
+        Elimina columnas legadas ya migradas (sus campos ya no son almacenados).
+        
+        El DROP espera un lock exclusivo de la tabla; si no lo obtiene pronto se
+        reintenta en la siguiente ejecución en lugar de frenar las peticiones.
+        """
+        cr = self.env.cr
+        try:
+            with cr.savepoint():
+                cr.execute("SET LOCAL lock_timeout = '5s'")
+                cr.execute(f"""
+                    ALTER TABLE biometric_auth_log
+                    {', '.join(f'DROP COLUMN {column}' for column in columns)}
+                """)
+        except LockNotAvailable:
+            _logger.info('Columnas legadas de logs en uso; se eliminarán en la próxima ejecución')
+        else:
+            _logger.info(f'Columnas legadas de logs eliminadas: {", ".join(columns)}')
+        cr.execute('SET LOCAL lock_timeout TO DEFAULT')
+    
+    @api.model
+    def _cron_backfill_names(self, batch_size=LOOKUP_BACKFILL_BATCH):
+        """
+        Cron de respaldo de la migración (la hace migrations/1.1.0/post-migrate.py).
+        
+        Los logs nuevos siempre reciben nombre al crearse: tras una pasada completa
+        no queda nada pendiente y el cron se desactiva.
+        """
+        filled = self._backfill_names(batch_size)
+        self.env['ir.cron']._notify_progress(done=filled, remaining=0, deactivate=True)
+    
+    @api.model
+    def _backfill_names(self, batch_size=LOOKUP_BACKFILL_BATCH, commit=True):
+        """
+        Completa por lotes (keyset por id, un commit por lote salvo commit=False) el
+        nombre almacenado de los logs anteriores, con el mismo formato que _make_name.
+        
+        Returns:
+            int: Logs completados
+        """
+        cr = self.env.cr
+        last_id = 0
+        filled = 0
+        while True:
+            cr.execute("""
+                SELECT max(id), count(*) FROM (
+                    SELECT id FROM biometric_auth_log
+                    WHERE name IS NULL AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                ) batch
+            """, (last_id, batch_size))
+            batch_end, count = cr.fetchone()
+            if not count:
+                break
+            # Subconsulta (no JOIN): los logs sin usuario también reciben nombre
+            cr.execute(f"""
+                UPDATE biometric_auth_log l SET name = {SQL_LOG_NAME}
+                WHERE l.name IS NULL AND l.id > %s AND l.id <= %s
+            """, (last_id, batch_end))
+            last_id = batch_end
+            filled += cr.rowcount
+            if commit:
+                cr.commit()
+        
+        if filled:
+            self.invalidate_model(['name'])
+            _logger.info(f'Nombres de logs completados: {filled}')
+        return filled
+    
+    @api.model
+    @api.readonly
     def get_device_auth_stats(self, device_id):
         """
         Obtiene estadísticas de autenticación de un dispositivo
@@ -316,32 +885,92 @@ class BiometricAuthLog(models.Model):
         Returns:
             dict: Estadísticas
         """
-        logs = self.search([('device_id', '=', device_id)])
+        device_id = int(device_id)
+        return self.get_devices_auth_stats([device_id])[device_id]
+    
+    @api.model
+    @api.readonly
+    def get_devices_auth_stats(self, device_ids, date_from=None, date_to=None):
+        """
+        Estadísticas de autenticación de varios dispositivos en una sola consulta
+        (GROUP BY device_id, success). Los intentos se cuentan por occurrence_count,
+        así que los fallos agrupados en ráfagas suman todos sus intentos.
         
-        total = len(logs)
-        successful = len(logs.filtered(lambda l: l.success))
-        failed = total - successful
+        Args:
+            device_ids (list): IDs de dispositivos
+            date_from (datetime): Inicio de la ventana (opcional, inclusive)
+            date_to (datetime): Fin de la ventana (opcional, exclusivo)
+            
+        Returns:
+            dict: {device_id: {total_attempts, successful, failed, success_rate,
+                   last_auth, avg_duration_ms}} (dispositivos sin logs en cero)
+        """
+        # Claves enteras aunque la API reciba los IDs como texto
+        device_ids = [int(device_id) for device_id in device_ids]
+        stats = {device_id: {
+            'total_attempts': 0,
+            'successful': 0,
+            'failed': 0,
+            'success_rate': 0,
+            'last_auth': None,
+            'avg_duration_ms': None,
+        } for device_id in device_ids}
+        if not device_ids:
+            return stats
         
-        return {
-            'total_attempts': total,
-            'successful': successful,
-            'failed': failed,
-            'success_rate': (successful / total * 100) if total > 0 else 0,
-            'last_auth': logs[0].auth_date.isoformat() if logs else None,
-        }
+        domain = [('device_id', 'in', list(device_ids))]
+        if date_from:
+            domain.append(('auth_date', '>=', date_from))
+        if date_to:
+            domain.append(('auth_date', '<', date_to))
+        
+        durations = {}
+        groups = self._read_group(
+            domain,
+            ['device_id', 'success'],
+            ['occurrence_count:sum', 'auth_date:max', 'last_occurrence_at:max',
+             'duration_ms:sum', 'duration_ms:count'],
+        )
+        for device, success, count, last_auth, last_occurrence, duration_sum, duration_count in groups:
+            item = stats[device.id]
+            count = count or 0
+            item['total_attempts'] += count
+            item['successful' if success else 'failed'] += count
+            last_auth = max(filter(None, [last_auth, last_occurrence]), default=None)
+            if last_auth and (not item['last_auth'] or last_auth > item['last_auth']):
+                item['last_auth'] = last_auth
+            total_sum, total_count = durations.get(device.id, (0, 0))
+            durations[device.id] = (total_sum + (duration_sum or 0), total_count + duration_count)
+        
+        for device_id, item in stats.items():
+            total = item['total_attempts']
+            item['success_rate'] = (item['successful'] / total * 100) if total > 0 else 0
+            item['last_auth'] = item['last_auth'].isoformat() if item['last_auth'] else None
+            duration_sum, duration_count = durations.get(device_id, (0, 0))
+            item['avg_duration_ms'] = round(duration_sum / duration_count) if duration_count else None
+        return stats
     
     @api.model
-    def log_traditional_login(self, session_id=None, device_info=None):
+    def log_traditional_login(self, session_id=None, device_info=None, idempotency_key=None):
         """
         Registra un login tradicional (usuario/contraseña)
         
         Args:
             session_id (str): ID de sesión
             device_info (dict): Información del dispositivo {device_name, platform}
+            idempotency_key (str): Clave de la app para reconocer reintentos
             
         Returns:
             dict: Resultado de la operación
         """
+        return self.env['biometric.idempotency.key']._run_once(
+            'log_traditional_login', idempotency_key,
+            lambda: self._log_traditional_login(session_id, device_info),
+        )
+    
+    @api.model
+    def _log_traditional_login(self, session_id=None, device_info=None):
+        """Registro efectivo del login tradicional (ver log_traditional_login)"""
         try:
             # Buscar dispositivo del usuario con coincidencia estricta
             device = None
@@ -391,6 +1020,11 @@ class BiometricAuthLog(models.Model):
             # Crear log (con sudo para evitar restricciones de acceso)
             log = self.sudo().create(log_data)
             
+            self.env['biometric.user.summary'].sudo()._record_auth(
+                self.env.user.id, True, log.auth_date, opens_session=True,
+            )
+            replica.mark_user_write()
+            
             _logger.info(f'Login tradicional registrado para {self.env.user.name}')
             
             return {
@@ -399,6 +1033,8 @@ class BiometricAuthLog(models.Model):
                 'message': 'Login registrado correctamente'
             }
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error registrando login tradicional: {str(e)}')
             return {
@@ -450,6 +1086,11 @@ class BiometricAuthLog(models.Model):
                     'session_active': False,
                     'session_ended_at': fields.Datetime.now()
                 })
+                self.env['biometric.user.summary'].sudo()._record_sessions_ended(
+                    current_user_id, len(active_sessions.filtered('success')),
+                )
+                active_sessions._bus_notify(BUS_SESSION_ENDED)
+                replica.mark_user_write()
                 
                 _logger.info(f'Sesión(es) finalizada(s) para {self.env.user.name}: {len(active_sessions)} sesiones')
                 
@@ -465,6 +1106,8 @@ class BiometricAuthLog(models.Model):
                 'message': 'No había sesiones activas'
             }
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error finalizando sesión: {str(e)}')
             return {
@@ -473,6 +1116,7 @@ class BiometricAuthLog(models.Model):
             }
     
     @api.model
+    @api.readonly
     def get_active_sessions(self, user_id=None):
         """
         Obtiene las sesiones activas de un usuario
@@ -579,6 +1223,10 @@ class BiometricAuthLog(models.Model):
                 'session_active': False,
                 'session_ended_at': fields.Datetime.now()
             })
+            if auth_log.success:
+                self.env['biometric.user.summary'].sudo()._record_sessions_ended(auth_log.user_id.id, 1)
+            auth_log._bus_notify(BUS_SESSION_DESTROYED)
+            replica.mark_user_write()
             
             _logger.info(f"✅ Sesión {session_id} marcada como finalizada")
             
@@ -588,6 +1236,8 @@ class BiometricAuthLog(models.Model):
                 'session_id': session_id
             }
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f"❌ Error al destruir sesión {session_id}: {str(e)}")
             return {
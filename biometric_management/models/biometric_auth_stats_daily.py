@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from .biometric_auth_log import SQL_LOG_DEVICE_PLATFORM
+import logging
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+# Días procesados por transacción en el cron de consolidación
+ROLLUP_DAYS_PER_BATCH = 7
+# Días cerrados que se recalculan en cada ejecución (logs que llegan tarde)
+ROLLUP_TRAILING_DAYS = 3
+
+
+class BiometricAuthStatsDaily(models.Model):
+    _name = 'biometric.auth.stats.daily'
+    _description = 'Estadísticas Diarias de Autenticación'
+    _order = 'day desc'
+
+    # ============================================
+    # CLAVE DE AGREGACIÓN
+    # ============================================
+    
+    day = fields.Date(
+        string='Día',
+        required=True,
+        readonly=True,
+        index=True,
+        help='Día (UTC) de las autenticaciones'
+    )
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        required=True,
+        readonly=True,
+        ondelete='cascade',
+        index=True
+    )
+    
+    device_id = fields.Many2one(
+        'biometric.device',
+        string='Dispositivo',
+        readonly=True,
+        ondelete='set null'
+    )
+    
+    platform = fields.Char(
+        string='Plataforma',
+        readonly=True
+    )
+    
+    auth_type = fields.Selection([
+        ('biometric', 'Biométrica'),
+        ('traditional', 'Tradicional'),
+        ('fallback', 'Alternativa'),
+        ('automatic', 'Automática')
+    ], string='Tipo Autenticación', required=True, readonly=True)
+    
+    # ============================================
+    # MÉTRICAS
+    # ============================================
+    
+    attempt_count = fields.Integer(
+        string='Intentos',
+        readonly=True
+    )
+    
+    success_count = fields.Integer(
+        string='Exitosas',
+        readonly=True
+    )
+    
+    failure_count = fields.Integer(
+        string='Fallidas',
+        readonly=True
+    )
+    
+    duration_ms_sum = fields.Integer(
+        string='Duración Total (ms)',
+        readonly=True
+    )
+    
+    duration_count = fields.Integer(
+        string='Intentos con Duración',
+        readonly=True,
+        help='Intentos que informaron duración (para calcular promedios)'
+    )
+    
+    def init(self):
+        # device_id y platform pueden ser NULL: la unicidad se define con COALESCE.
+        # Al eliminar dispositivos sus filas se fusionan antes en la fila sin
+        # dispositivo (_detach_devices): el SET NULL de la FK nunca llega a
+        # producir dos filas con la misma clave
+        self._cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS biometric_auth_stats_daily_key_uniq
+            ON biometric_auth_stats_daily (day, user_id, COALESCE(device_id, 0), COALESCE(platform, ''), auth_type)
+        """)
+        # Días cerrados con logs creados, modificados o borrados después de cerrar
+        # (fuera de la ventana que se recalcula siempre): el cron los vuelve a consolidar
+        self._cr.execute("""
+            CREATE TABLE IF NOT EXISTS biometric_auth_stats_dirty_day (
+                day date PRIMARY KEY
+            )
+        """)
+    
+    # ============================================
+    # ELIMINACIÓN DE DISPOSITIVOS
+    # ============================================
+    
+    @api.model
+    def _detach_devices(self, device_ids):
+        """
+        Fusiona las filas de los dispositivos indicados en la fila sin dispositivo
+        del mismo (día, usuario, plataforma, tipo), antes de eliminarlos.
+        
+        Dos dispositivos del mismo usuario y plataforma usados el mismo día (p. ej.
+        un teléfono reemplazado por otro igual) quedarían con la misma clave al
+        pasar device_id a NULL. Es el mismo resultado que da _rollup_days sobre los
+        logs, cuyo device_id también pasa a NULL al borrar el dispositivo.
+        
+        Args:
+            device_ids (list): Dispositivos que se van a eliminar
+        """
+        if not device_ids:
+            return
+        self.flush_model()
+        cr = self.env.cr
+        cr.execute("""
+            INSERT INTO biometric_auth_stats_daily AS t (
+                day, user_id, device_id, platform, auth_type,
+                attempt_count, success_count, failure_count,
+                duration_ms_sum, duration_count,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT day, user_id, NULL, platform, auth_type,
+                   sum(attempt_count), sum(success_count), sum(failure_count),
+                   sum(duration_ms_sum), sum(duration_count),
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM biometric_auth_stats_daily
+            WHERE device_id = ANY(%(device_ids)s)
+            GROUP BY day, user_id, platform, auth_type
+            ON CONFLICT (day, user_id, COALESCE(device_id, 0), COALESCE(platform, ''), auth_type)
+            DO UPDATE SET
+                attempt_count = t.attempt_count + EXCLUDED.attempt_count,
+                success_count = t.success_count + EXCLUDED.success_count,
+                failure_count = t.failure_count + EXCLUDED.failure_count,
+                duration_ms_sum = t.duration_ms_sum + EXCLUDED.duration_ms_sum,
+                duration_count = t.duration_count + EXCLUDED.duration_count,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, {'uid': self.env.uid, 'device_ids': list(device_ids)})
+        cr.execute(
+            'DELETE FROM biometric_auth_stats_daily WHERE device_id = ANY(%s)',
+            (list(device_ids),)
+        )
+        self.invalidate_model()
+    
+    # ============================================
+    # CONSOLIDACIÓN (CRON)
+    # ============================================
+    
+    @api.model
+    def _mark_dirty_days(self, days):
+        """
+        Anota días ya cerrados (anteriores a hoy, UTC) cuyos logs cambiaron, para que
+        el cron los vuelva a consolidar. Los logs del día en curso no anotan nada.
+        
+        Args:
+            days (iterable): Fechas (date) de los logs afectados
+        """
+        today = fields.Datetime.now().date()
+        days = sorted({day for day in days if day and day < today})
+        if not days:
+            return
+        self.env.cr.execute("""
+            INSERT INTO biometric_auth_stats_dirty_day (day)
+            SELECT unnest(%s::date[])
+            ON CONFLICT (day) DO NOTHING
+        """, (days,))
+    
+    @api.model
+    def _cron_rollup_daily(self):
+        """
+        Consolida los logs de autenticación por día.
+        
+        Procesa los días cerrados (anteriores a hoy, UTC) desde el último consolidado
+        y vuelve a calcular siempre los últimos ROLLUP_TRAILING_DAYS, además de los
+        días anotados por _mark_dirty_days: los logs que llegan tarde o se editan
+        después de cerrar el día no quedan fuera de las estadísticas. Cada lote de
+        días se reemplaza y se confirma en su propia transacción, por lo que una
+        ejecución interrumpida continúa donde quedó.
+        """
+        cr = self.env.cr
+        self.env['biometric.auth.log'].flush_model()
+        today = cr.now().date()
+        
+        cr.execute('SELECT max(day) FROM biometric_auth_stats_daily')
+        last_day = cr.fetchone()[0]
+        if last_day:
+            start = min(last_day + timedelta(days=1), today - timedelta(days=ROLLUP_TRAILING_DAYS))
+        else:
+            cr.execute('SELECT min(auth_date)::date FROM biometric_auth_log')
+            start = cr.fetchone()[0]
+            if not start:
+                return
+        
+        # Días anotados anteriores a la ventana: se recalculan de a uno
+        cr.execute("""
+            DELETE FROM biometric_auth_stats_dirty_day
+            WHERE day < %s
+            RETURNING day
+        """, (start,))
+        for (day,) in sorted(cr.fetchall()):
+            self._rollup_days(day, day + timedelta(days=1))
+            _logger.info(f'Estadísticas diarias recalculadas (logs tardíos): {day}')
+        cr.execute('DELETE FROM biometric_auth_stats_dirty_day WHERE day >= %s', (start,))
+        cr.commit()
+        
+        while start < today:
+            end = min(today, start + timedelta(days=ROLLUP_DAYS_PER_BATCH))
+            self._rollup_days(start, end)
+            cr.commit()
+            _logger.info(f'Estadísticas diarias consolidadas: {start} a {end - timedelta(days=1)}')
+            start = end
+    
+    @api.model
+    def _rollup_days(self, start, end):
+        """
+        (Re)calcula las filas de los días en [start, end) desde los logs
+        
+        Args:
+            start (date): Primer día (incluido)
+            end (date): Último día (excluido)
+        """
+        cr = self.env.cr
+        cr.execute(
+            'DELETE FROM biometric_auth_stats_daily WHERE day >= %s AND day < %s',
+            (start, end)
+        )
+        cr.execute(f"""
+            INSERT INTO biometric_auth_stats_daily (
+                day, user_id, device_id, platform, auth_type,
+                attempt_count, success_count, failure_count,
+                duration_ms_sum, duration_count,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT l.auth_date::date, l.user_id, l.device_id, {SQL_LOG_DEVICE_PLATFORM}, l.auth_type,
+                   sum(COALESCE(l.occurrence_count, 1)),
+                   COALESCE(sum(COALESCE(l.occurrence_count, 1)) FILTER (WHERE l.success), 0),
+                   COALESCE(sum(COALESCE(l.occurrence_count, 1)) FILTER (WHERE l.success IS NOT TRUE), 0),
+                   COALESCE(sum(l.duration_ms), 0),
+                   count(l.duration_ms),
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM biometric_auth_log l
+            LEFT JOIN biometric_device d ON d.id = l.device_id
+            LEFT JOIN biometric_device_snapshot s ON s.id = l.device_snapshot_id
+            WHERE l.auth_date >= %(start)s AND l.auth_date < %(end)s
+            GROUP BY l.auth_date::date, l.user_id, l.device_id, {SQL_LOG_DEVICE_PLATFORM}, l.auth_type
+        """, {'uid': self.env.uid, 'start': start, 'end': end})
+        self.invalidate_model()
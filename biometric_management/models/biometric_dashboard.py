@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import AccessError
+import time
+from datetime import timedelta
+
+# Tiempo de vida (segundos) del tablero en caché
+DASHBOARD_CACHE_TTL = 60
+# Máximo de tableros en caché por proceso (combinaciones de base, days y top)
+DASHBOARD_CACHE_SIZE = 128
+# Ventana por defecto (días) para tasas de fallo y dispositivos con más fallos
+DASHBOARD_DAYS = 14
+
+# Caché por proceso: (dbname, days, top) -> (expira_en, datos)
+_dashboard_cache = {}
+
+
+class BiometricDashboard(models.AbstractModel):
+    _name = 'biometric.dashboard'
+    _description = 'Tablero de Dispositivos Biométricos'
+
+    @api.model
+    @api.readonly
+    def get_manager_dashboard(self, days=DASHBOARD_DAYS, top=10):
+        """
+        Salud de la flota para managers, cacheada por DASHBOARD_CACHE_TTL segundos.
+        
+        Args:
+            days (int): Días hacia atrás para tasas de fallo y top de fallos
+            top (int): Cantidad de dispositivos en el top de fallos
+            
+        Returns:
+            dict: {generated_at, fleet, totals, stale_devices, failure_rates, top_failing_devices}
+        """
+        if not self.env.user.has_group('biometric_management.group_biometric_manager'):
+            raise AccessError('Solo managers pueden consultar el tablero biométrico.')
+        
+        days = max(1, min(int(days), 365))
+        top = max(1, min(int(top), 100))
+        key = (self.env.cr.dbname, days, top)
+        now = time.monotonic()
+        
+        cached = _dashboard_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        data = self._compute_manager_dashboard(days, top)
+        # Al guardar se descartan los vencidos; si aun así se supera el tope, se vacía
+        for stale_key, (expires_at, _data) in list(_dashboard_cache.items()):
+            if expires_at <= now:
+                _dashboard_cache.pop(stale_key, None)
+        if len(_dashboard_cache) >= DASHBOARD_CACHE_SIZE:
+            _dashboard_cache.clear()
+        _dashboard_cache[key] = (now + DASHBOARD_CACHE_TTL, data)
+        return data
+    
+    @api.model
+    def _compute_manager_dashboard(self, days, top):
+        """Calcula el tablero con consultas agrupadas (sin caché)"""
+        cr = self.env.cr
+        self.env['biometric.device'].flush_model()
+        self.env['biometric.auth.log'].flush_model()
+        
+        now = cr.now()
+        today = now.date()
+        window_start = today - timedelta(days=days - 1)
+        stale_days = self.env['biometric.device']._get_stale_days()
+        # 0 = la inactividad por tiempo está deshabilitada
+        stale_limit = now - timedelta(days=stale_days) if stale_days > 0 else None
+        
+        # 1. Flota por plataforma / tipo biométrico / estado (+ inactivos por tiempo)
+        cr.execute("""
+            SELECT platform, biometric_type, state, count(*),
+                   count(*) FILTER (WHERE state != 'revoked'
+                                    AND COALESCE(last_used_at, enrolled_at) < %(stale_limit)s)
+            FROM biometric_device
+            WHERE active
+            GROUP BY platform, biometric_type, state
+        """, {'stale_limit': stale_limit})
+        fleet = {}
+        totals = {'active': 0, 'inactive': 0, 'revoked': 0}
+        stale_total = 0
+        for platform, biometric_type, state, count, stale in cr.fetchall():
+            entry = fleet.setdefault((platform, biometric_type), {
+                'platform': platform,
+                'biometricType': biometric_type,
+                'active': 0,
+                'inactive': 0,
+                'revoked': 0,
+                'stale': 0,
+            })
+            entry[state] = count
+            entry['stale'] += stale
+            totals[state] = totals.get(state, 0) + count
+            stale_total += stale
+        
+        # 2. Fallos por día: días consolidados + cola sin consolidar desde los logs
+        cr.execute('SELECT max(day) FROM biometric_auth_stats_daily')
+        last_rollup_day = cr.fetchone()[0]
+        raw_from = max(window_start, last_rollup_day + timedelta(days=1)) if last_rollup_day else window_start
+        
+        window_sql = """
+            WITH window_stats AS (
+                SELECT day, device_id, attempt_count AS attempts, failure_count AS failures
+                FROM biometric_auth_stats_daily
+                WHERE day >= %(window_start)s AND day < %(raw_from)s
+                UNION ALL
+                SELECT auth_date::date, device_id, COALESCE(occurrence_count, 1),
+                       CASE WHEN success THEN 0 ELSE COALESCE(occurrence_count, 1) END
+                FROM biometric_auth_log
+                WHERE auth_date >= %(raw_from)s
+            )
+        """
+        params = {'window_start': window_start, 'raw_from': raw_from}
+        
+        cr.execute(window_sql + """
+            SELECT day, sum(attempts), sum(failures)
+            FROM window_stats
+            GROUP BY day
+            ORDER BY day
+        """, params)
+        failure_rates = [{
+            'day': day.isoformat(),
+            'attempts': attempts,
+            'failures': failures,
+            'failure_rate': round(failures / attempts * 100, 2) if attempts else 0,
+        } for day, attempts, failures in cr.fetchall()]
+        
+        # 3. Dispositivos con más fallos en la ventana
+        cr.execute(window_sql + """
+            SELECT w.device_id, d.device_name, d.platform, d.user_id,
+                   sum(w.attempts), sum(w.failures)
+            FROM window_stats w
+            JOIN biometric_device d ON d.id = w.device_id
+            GROUP BY w.device_id, d.device_name, d.platform, d.user_id
+            HAVING sum(w.failures) > 0
+            ORDER BY sum(w.failures) DESC
+            LIMIT %(top)s
+        """, dict(params, top=top))
+        top_failing = [{
+            'id': device_id,
+            'deviceName': device_name,
+            'platform': platform,
+            'userId': user_id,
+            'attempts': attempts,
+            'failures': failures,
+            'failure_rate': round(failures / attempts * 100, 2) if attempts else 0,
+        } for device_id, device_name, platform, user_id, attempts, failures in cr.fetchall()]
+        
+        return {
+            'generated_at': fields.Datetime.to_string(now),
+            'window_days': days,
+            'stale_days': stale_days,
+            'fleet': list(fleet.values()),
+            'totals': totals,
+            'stale_devices': stale_total,
+            'failure_rates': failure_rates,
+            'top_failing_devices': top_failing,
+        }
\ No newline at end of file
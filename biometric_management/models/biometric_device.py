@@ -1,12 +1,46 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index, column_exists, ormcache
+from odoo.service.model import PG_CONCURRENCY_EXCEPTIONS_TO_RETRY
+from psycopg2.errors import LockNotAvailable
+from psycopg2.extras import execute_values
+from odoo.addons.biometric_management import replica
+import base64
 import logging
 import json
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Máximo de logs devueltos por llamada de sincronización
+SYNC_LOG_LIMIT = 200
+
+# Atributos de device_info extraídos a columnas indexadas → claves posibles en el JSON de la app
+DEVICE_INFO_COLUMNS = {
+    'manufacturer': ('manufacturer', 'brand'),
+    'os_api_level': ('platformApiLevel', 'apiLevel', 'api_level', 'sdkInt'),
+    'app_version': ('appVersion', 'nativeApplicationVersion', 'applicationVersion', 'app_version'),
+    'security_patch': ('securityPatch', 'securityPatchLevel', 'security_patch'),
+}
+# Filas por lote (y por commit) al migrar el JSON legado a JSONB
+DEVICE_INFO_BACKFILL_BATCH = 1000
+# Dispositivos por lote (y por commit) en la desactivación por inactividad
+STALE_BATCH_SIZE = 1000
+# Notificaciones del bus (websocket) hacia la app del usuario afectado
+BUS_DEVICE_REVOKED = 'biometric/device_revoked'
+BUS_DEVICE_DEACTIVATED = 'biometric/device_deactivated'
+# Payloads de API cacheados por proceso (LRU)
+DEVICE_PAYLOAD_CACHE_SIZE = 4096
+
+# Caché de payloads: {(db, device id): (versión, payload)}; la versión es
+# (write_date del dispositivo, versión del resumen del usuario), así que una
+# entrada desactualizada simplemente deja de coincidir
+_payload_cache = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
 
 class BiometricDevice(models.Model):
     _name = 'biometric.device'
@@ -160,11 +194,43 @@ class BiometricDevice(models.Model):
     # INFORMACIÓN ADICIONAL
     # ============================================
     
+    device_info = fields.Json(
+        string='Info Completa',
+        help='Información completa del dispositivo (JSONB con índice GIN)'
+    )
+    
     device_info_json = fields.Text(
         string='Info Completa (JSON)',
+        compute='_compute_device_info_json',
+        inverse='_inverse_device_info_json',
         help='Información completa del dispositivo en formato JSON'
     )
     
+    # Atributos extraídos de device_info para consultas de flota
+    manufacturer = fields.Char(
+        string='Fabricante',
+        index=True,
+        help='Fabricante informado por la app'
+    )
+    
+    os_api_level = fields.Integer(
+        string='Nivel API OS',
+        index=True,
+        help='Nivel de API del sistema operativo (Android)'
+    )
+    
+    app_version = fields.Char(
+        string='Versión App',
+        index=True,
+        help='Versión de la aplicación móvil'
+    )
+    
+    security_patch = fields.Char(
+        string='Parche de Seguridad',
+        index=True,
+        help='Nivel de parche de seguridad (AAAA-MM-DD)'
+    )
+    
     notes = fields.Text(
         string='Notas',
         help='Notas adicionales sobre el dispositivo'
@@ -202,9 +268,9 @@ class BiometricDevice(models.Model):
     )
     
     is_stale = fields.Boolean(
-        string='Inactivo (>30 días)',
+        string='Inactivo (sin uso prolongado)',
         compute='_compute_is_stale',
-        help='Más de 30 días sin usar',
+        help='Más días sin usar que los definidos en biometric.device.stale.days',
         store=True
     )
     
@@ -218,10 +284,116 @@ class BiometricDevice(models.Model):
          'Este dispositivo ya está registrado para este usuario.'),
     ]
     
+    def init(self):
+        # Índice para la sincronización delta (cambios por usuario desde un watermark)
+        create_index(
+            self._cr,
+            'biometric_device_user_write_date_idx',
+            self._table,
+            ['user_id', 'write_date'],
+        )
+        # Buffer de actividad: inserciones sin bloquear la fila del dispositivo,
+        # consolidadas periódicamente por _flush_activity_buffer (UNLOGGED: perderlo
+        # en una caída solo atrasa last_used_at de los últimos segundos)
+        self._cr.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS biometric_device_activity (
+                device_id integer NOT NULL,
+                used_at timestamp without time zone NOT NULL
+            )
+        """)
+        create_index(
+            self._cr,
+            'biometric_device_activity_device_idx',
+            'biometric_device_activity',
+            ['device_id', 'used_at'],
+        )
+        # Consultas de contención sobre el JSON completo (device_info @> '{...}')
+        create_index(
+            self._cr,
+            'biometric_device_device_info_gin_idx',
+            self._table,
+            ['device_info jsonb_path_ops'],
+            method='gin',
+        )
+        # Límite de dispositivos por usuario: conteo de activos resuelto solo con el índice
+        create_index(
+            self._cr,
+            'biometric_device_user_active_idx',
+            self._table,
+            ['user_id'],
+            where="state = 'active' AND active",
+        )
+        # Fila de control por usuario para el límite de dispositivos: las altas
+        # concurrentes del mismo usuario chocan en ella y se serializan
+        self._cr.execute("""
+            CREATE TABLE IF NOT EXISTS biometric_device_quota (
+                user_id integer PRIMARY KEY REFERENCES res_users(id) ON DELETE CASCADE,
+                active_count integer NOT NULL DEFAULT 0
+            )
+        """)
+    
     # ============================================
     # CAMPOS COMPUTADOS - MÉTODOS
     # ============================================
     
+    @api.depends('device_info')
+    def _compute_device_info_json(self):
+        """Representación en texto de device_info (compatibilidad con API y vista)"""
+        for record in self:
+            info = record.device_info
+            if info is None or info is False:
+                record.device_info_json = False
+            elif isinstance(info, dict) and set(info) == {'_raw'}:
+                # Texto que no era JSON válido: se devuelve tal cual se recibió
+                record.device_info_json = info['_raw']
+            else:
+                record.device_info_json = json.dumps(info, ensure_ascii=False)
+    
+    def _inverse_device_info_json(self):
+        """Guarda el texto como JSONB y extrae los atributos indexados"""
+        for record in self:
+            info = self._parse_device_info(record.device_info_json)
+            record.write(dict(self._extract_device_info_columns(info), device_info=info))
+    
+    @api.model
+    def _parse_device_info(self, raw):
+        """
+        Convierte el JSON recibido de la app en un valor para device_info
+        
+        Returns:
+            dict|list|None: JSON decodificado, {'_raw': texto} si no es válido, None si vacío
+        """
+        if not raw:
+            return None
+        if isinstance(raw, (dict, list)):
+            return raw
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return {'_raw': raw}
+    
+    @api.model
+    def _extract_device_info_columns(self, info):
+        """
+        Extrae los atributos de DEVICE_INFO_COLUMNS de device_info
+        
+        Returns:
+            dict: Valores para manufacturer, os_api_level, app_version y security_patch
+        """
+        info = info if isinstance(info, dict) else {}
+        values = {}
+        for column, keys in DEVICE_INFO_COLUMNS.items():
+            value = next((info[key] for key in keys if info.get(key) not in (None, '')), None)
+            if column == 'os_api_level':
+                try:
+                    value = int(value) if value is not None else False
+                except (TypeError, ValueError):
+                    value = False
+            else:
+                value = str(value)[:64] if value is not None else False
+            values[column] = value
+        return values
+    
     @api.depends('user_id')
     def _compute_employee_id(self):
         """Relaciona el dispositivo con el empleado del usuario"""
@@ -258,15 +430,73 @@ class BiometricDevice(models.Model):
     
     @api.depends('last_used_at', 'enrolled_at')
     def _compute_is_stale(self):
-        """Determina si está inactivo (>30 días)"""
+        """Determina si está inactivo (más de biometric.device.stale.days días)"""
+        stale_days = self._get_stale_days()
         for record in self:
             reference_date = record.last_used_at or record.enrolled_at
-            if reference_date:
+            if reference_date and stale_days > 0:
                 delta = fields.Datetime.now() - reference_date
-                record.is_stale = delta.days > 30
+                record.is_stale = delta.days > stale_days
             else:
                 record.is_stale = False
     
+    @api.model
+    def _get_stale_days(self):
+        """Días sin uso para considerar un dispositivo inactivo (0 = nunca)"""
+        return int(self.env['ir.config_parameter'].sudo().get_param('biometric.device.stale.days', 30))
+    
+    @api.model
+    @ormcache()
+    def _get_max_devices_per_user(self):
+        """
+        Máximo de dispositivos activos por usuario (0 = ilimitado).
+        Cacheado en el registro: ir.config_parameter limpia la caché al modificar parámetros.
+        """
+        value = self.env['ir.config_parameter'].sudo().get_param('biometric.max.devices.per.user', 0)
+        try:
+            return max(int(value or 0), 0)
+        except ValueError:
+            _logger.warning(f'biometric.max.devices.per.user inválido: {value!r}')
+            return 0
+    
+    @api.model
+    def _check_device_limit(self, additions):
+        """
+        Verifica el límite de dispositivos activos antes de activar nuevos.
+        
+        El conteo se hace con el índice parcial de activos y se guarda en la fila
+        de control del usuario (upsert). Dos altas concurrentes del mismo usuario
+        compiten por esa fila: la segunda espera y falla por serialización, y Odoo
+        reintenta la transacción con un snapshot que ya ve el dispositivo de la primera.
+        Para eso el error no debe quedar atrapado: los llamadores dejan pasar
+        PG_CONCURRENCY_EXCEPTIONS_TO_RETRY antes de sus except genéricos.
+        
+        Args:
+            additions (dict): {user_id: dispositivos que pasan a activos}
+        """
+        max_devices = self._get_max_devices_per_user()
+        if not max_devices:
+            return
+        self.flush_model(['user_id', 'state', 'active'])
+        for user_id, count in additions.items():
+            if not user_id or not count:
+                continue
+            self.env.cr.execute("""
+                INSERT INTO biometric_device_quota AS q (user_id, active_count)
+                VALUES (%(user_id)s, (
+                    SELECT count(*) FROM biometric_device
+                    WHERE user_id = %(user_id)s AND state = 'active' AND active
+                ))
+                ON CONFLICT (user_id) DO UPDATE SET active_count = EXCLUDED.active_count
+                RETURNING active_count
+            """, {'user_id': user_id})
+            active_count = self.env.cr.fetchone()[0]
+            if active_count + count > max_devices:
+                raise UserError(
+                    f'Se alcanzó el máximo de {max_devices} dispositivos activos por usuario. '
+                    f'Revoque un dispositivo antes de registrar otro.'
+                )
+    
     @api.depends('device_id')
     def _compute_auth_stats(self):
         """Calcula estadísticas de autenticación"""
@@ -296,8 +526,18 @@ class BiometricDevice(models.Model):
                 if not user.exists():
                     raise ValidationError('El usuario especificado no existe.')
         
+        # Límite de dispositivos activos por usuario
+        additions = {}
+        for vals in vals_list:
+            if vals.get('state', 'active') == 'active' and vals.get('active', True):
+                user_id = vals.get('user_id') or self.env.user.id
+                additions[user_id] = additions.get(user_id, 0) + 1
+        self._check_device_limit(additions)
+        
         # Crear dispositivos
         devices = super(BiometricDevice, self).create(vals_list)
+        self.env['biometric.user.summary'].sudo()._refresh_device_counts(devices.user_id.ids)
+        replica.mark_user_write()
         
         for device in devices:
             _logger.info(
@@ -315,14 +555,37 @@ class BiometricDevice(models.Model):
             vals['revoked_by'] = self.env.user.id
             vals['is_enabled'] = False
         
+        # Límite de dispositivos: solo cuentan los que pasan a activos (los ya
+        # activos, p. ej. al re-registrar, no tocan la fila de control)
+        if vals.get('state') == 'active' or vals.get('active') or 'user_id' in vals:
+            additions = {}
+            for record in self:
+                state = vals.get('state', record.state)
+                active = vals.get('active', record.active)
+                user_id = vals.get('user_id', record.user_id.id)
+                was_counted = record.state == 'active' and record.active and record.user_id.id == user_id
+                if state == 'active' and active and not was_counted:
+                    additions[user_id] = additions.get(user_id, 0) + 1
+            self._check_device_limit(additions)
+        
+        summary_user_ids = self.user_id.ids if {'state', 'active', 'user_id'} & set(vals) else []
+        
         result = super(BiometricDevice, self).write(vals)
         
+        if summary_user_ids:
+            self.env['biometric.user.summary'].sudo()._refresh_device_counts(
+                summary_user_ids + self.user_id.ids
+            )
+        replica.mark_user_write()
+        
         if 'state' in vals and vals['state'] == 'revoked':
             for record in self:
                 _logger.info(
                     f'Dispositivo revocado: {record.device_name} '
                     f'por {self.env.user.name}'
                 )
+            # La app se entera al instante (sin esperar a su sondeo de validate_device)
+            self._bus_notify(BUS_DEVICE_REVOKED)
         
         return result
     
@@ -334,7 +597,36 @@ class BiometricDevice(models.Model):
                 f'del usuario {record.user_id.name}'
             )
         
-        return super(BiometricDevice, self).unlink()
+        # Tombstones para que la sincronización delta informe la eliminación
+        self.env['biometric.device.tombstone'].sudo().create([{
+            'user_id': record.user_id.id,
+            'device_ref': record.id,
+            'device_id': record.device_id,
+        } for record in self])
+        
+        # Estadísticas diarias: fusionar en la fila sin dispositivo antes del SET NULL
+        self.env['biometric.auth.stats.daily'].sudo()._detach_devices(self.ids)
+        
+        user_ids = self.user_id.ids
+        result = super(BiometricDevice, self).unlink()
+        self.env['biometric.user.summary'].sudo()._refresh_device_counts(user_ids)
+        replica.mark_user_write()
+        return result
+    
+    def _bus_notify(self, notification_type, **payload):
+        """
+        Publica una notificación en el canal del bus del usuario propietario de cada
+        dispositivo. Se entrega al confirmar la transacción; la app filtra por deviceId.
+        """
+        self.env['bus.bus'].sudo()._sendmany([
+            (device.user_id.partner_id, notification_type, dict(
+                payload,
+                deviceId=device.device_id,
+                deviceOdooId=device.id,
+                state=device.state,
+            ))
+            for device in self
+        ])
     
     # ============================================
     # MÉTODOS DE NEGOCIO
@@ -387,14 +679,149 @@ class BiometricDevice(models.Model):
         }
     
     def update_last_used(self):
-        """Actualiza el timestamp de último uso"""
+        """
+        Actualiza el timestamp de último uso
+        
+        Si el dispositivo ya está activo se usa el camino liviano (_touch_last_used);
+        un cambio de estado sigue pasando por write() para quedar en el chatter.
+        La reactivación va en un savepoint: si el usuario ya alcanzó el límite de
+        dispositivos solo se marca el uso, sin abortar la operación que la invocó
+        (p. ej. el registro de la autenticación).
+        """
         self.ensure_one()
-        self.write({
-            'last_used_at': fields.Datetime.now(),
-            'state': 'active'
-        })
         
-        _logger.debug(f'Actualizado last_used para dispositivo: {self.device_name}')
+        if self.state != 'active':
+            try:
+                with self.env.cr.savepoint():
+                    self.write({
+                        'last_used_at': fields.Datetime.now(),
+                        'state': 'active'
+                    })
+            except (UserError, ValidationError) as e:
+                self.env.invalidate_all(flush=False)
+                _logger.warning(f'No se reactivó el dispositivo {self.device_name}: {e}')
+                return self._touch_last_used()
+            _logger.debug(f'Actualizado last_used para dispositivo: {self.device_name}')
+            return True
+        
+        return self._touch_last_used()
+    
+    def _touch_last_used(self):
+        """
+        Marca el uso del dispositivo con debounce y sin pasar por el ORM.
+        
+        No hace nada si el último uso (incluyendo el pendiente en el buffer) ya está
+        dentro de la ventana ``biometric.device.touch.window.seconds``. Si no, inserta
+        una fila en el buffer de actividad: no toma el lock de la fila del dispositivo,
+        por lo que autenticaciones concurrentes en un mismo dispositivo no se
+        serializan. _flush_activity_buffer consolida el buffer con un UPDATE masivo.
+        
+        Returns:
+            bool: True si se registró el uso
+        """
+        self.ensure_one()
+        window = int(self.env['ir.config_parameter'].sudo().get_param(
+            'biometric.device.touch.window.seconds', 60))
+        now = fields.Datetime.now()
+        threshold = now - timedelta(seconds=window)
+        
+        if self.last_used_at and self.last_used_at >= threshold:
+            return False
+        pending = self._get_pending_last_used().get(self.id)
+        if pending and pending >= threshold:
+            return False
+        
+        self.check_access('write')
+        self.env.cr.execute(
+            'INSERT INTO biometric_device_activity (device_id, used_at) VALUES (%s, %s)',
+            (self.id, now)
+        )
+        _logger.debug(f'Uso registrado en buffer para dispositivo: {self.device_name}')
+        return True
+    
+    def _get_pending_last_used(self):
+        """
+        Último uso pendiente en el buffer de actividad (aún no consolidado)
+        
+        Returns:
+            dict: {device_id: datetime}
+        """
+        # Las tablas UNLOGGED no se replican: en un cursor sobre la réplica se omite
+        # el buffer y se usa last_used_at consolidado (en el primario, aun en modo
+        # solo lectura, el buffer se lee)
+        if not self.ids or replica.cursor_on_replica(self.env.cr):
+            return {}
+        self.env.cr.execute("""
+            SELECT device_id, max(used_at) FROM biometric_device_activity
+            WHERE device_id = ANY(%s)
+            GROUP BY device_id
+        """, (list(self.ids),))
+        return dict(self.env.cr.fetchall())
+    
+    @api.model
+    def _flush_activity_buffer(self):
+        """
+        Consolida el buffer de actividad en biometric_device con un único UPDATE.
+        
+        Las filas se borran y se aplican en la misma sentencia; las insertadas por
+        transacciones concurrentes quedan para la siguiente ejecución.
+        
+        Returns:
+            int: Dispositivos actualizados
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            WITH moved AS (
+                DELETE FROM biometric_device_activity
+                RETURNING device_id, used_at
+            ), pending AS (
+                SELECT device_id, max(used_at) AS used_at
+                FROM moved
+                GROUP BY device_id
+            )
+            UPDATE biometric_device AS d
+            SET last_used_at = pending.used_at,
+                days_since_last_use = 0,
+                is_recently_used = TRUE,
+                is_stale = FALSE,
+                write_date = now() AT TIME ZONE 'UTC',
+                write_uid = %s
+            FROM pending
+            WHERE d.id = pending.device_id
+              AND (d.last_used_at IS NULL OR d.last_used_at < pending.used_at)
+        """, (self.env.uid,))
+        updated = self.env.cr.rowcount
+        self.invalidate_model([
+            'last_used_at', 'days_since_last_use', 'is_recently_used',
+            'is_stale', 'write_date', 'write_uid',
+        ])
+        return updated
+    
+    @api.model
+    def _cron_flush_activity(self):
+        """Cron: consolida el buffer de actividad de dispositivos"""
+        updated = self._flush_activity_buffer()
+        if updated:
+            _logger.debug(f'Buffer de actividad consolidado: {updated} dispositivos')
+    
+    def _job_adopt_orphan_session(self):
+        """
+        Job: asigna al dispositivo la sesión activa más reciente del usuario que
+        quedó sin dispositivo (ej. login tradicional previo al registro)
+        """
+        self.ensure_one()
+        
+        orphan_session = self.env['biometric.auth.log'].search([
+            ('user_id', '=', self.user_id.id),
+            ('session_active', '=', True),
+            ('device_id', '=', False)
+        ], limit=1, order='auth_date desc')
+        
+        if orphan_session:
+            # Validar que los datos directos coincidan con la plataforma si existen
+            if not orphan_session.device_platform_direct or orphan_session.device_platform_direct == self.platform:
+                orphan_session.sudo().write({'device_id': self.id})
+                _logger.info(f'Sesión huérfana {orphan_session.id} asignada al dispositivo {self.device_name}')
     
     # ============================================
     # MÉTODOS API PARA LA APP
@@ -412,11 +839,22 @@ class BiometricDevice(models.Model):
         Returns:
             dict: Información del dispositivo creado
         """
+        # Si device_data es None, usar kwargs directamente (JSON-RPC call)
+        if device_data is None:
+            device_data = kwargs
+        device_data = dict(device_data)
+        
+        # Clave de idempotencia: un reintento devuelve el resultado original sin escribir
+        idempotency_key = device_data.pop('idempotency_key', None)
+        return self.env['biometric.idempotency.key']._run_once(
+            'register_device', idempotency_key,
+            lambda: self._register_device(device_data),
+        )
+    
+    @api.model
+    def _register_device(self, device_data):
+        """Registro efectivo del dispositivo (ver register_device)"""
         try:
-            # Si device_data es None, usar kwargs directamente (JSON-RPC call)
-            if device_data is None:
-                device_data = kwargs
-            
             # Validar datos requeridos
             required_fields = ['device_id', 'device_name', 'platform', 'biometric_type']
             for field in required_fields:
@@ -442,6 +880,8 @@ class BiometricDevice(models.Model):
                     'last_used_at': fields.Datetime.now(),
                     'state': 'active',
                     'is_enabled': True,
+                    **({'device_info_json': device_data['device_info_json']}
+                       if device_data.get('device_info_json') else {}),
                 })
                 device = existing
                 _logger.info(f'Dispositivo actualizado: {device.device_name}')
@@ -450,38 +890,34 @@ class BiometricDevice(models.Model):
                 device = self.create(device_data)
                 _logger.info(f'Nuevo dispositivo registrado: {device.device_name}')
             
-            # 🔧 ADOPCIÓN DE SESIÓN:
+            # 🔧 ADOPCIÓN DE SESIÓN (diferida, no crítica para el registro):
             # Si hay una sesión activa sin dispositivo (ej. el login tradicional que acaba de ocurrir),
-            # asignarla a este dispositivo recién creado para que aparezca "Activo" de inmediato.
-            try:
-                orphan_session = self.env['biometric.auth.log'].search([
-                    ('user_id', '=', self.env.user.id),
-                    ('session_active', '=', True),
-                    ('device_id', '=', False)
-                ], limit=1, order='auth_date desc')
-                
-                if orphan_session:
-                    # Validar que los datos directos coincidan con la plataforma si existen
-                    if not orphan_session.device_platform_direct or orphan_session.device_platform_direct == device.platform:
-                        orphan_session.sudo().write({'device_id': device.id})
-                        _logger.info(f'Sesión huérfana {orphan_session.id} asignada al dispositivo {device.device_name}')
-            except Exception as e:
-                _logger.warning(f'Error asignando sesión huérfana: {e}')
+            # asignarla a este dispositivo recién creado para que aparezca "Activo".
+            self.env['biometric.job']._enqueue(
+                device,
+                '_job_adopt_orphan_session',
+                description=f'Adoptar sesión huérfana: {device.device_name}',
+                urgent=True,
+            )
             
             return device._format_device_data()
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error registrando dispositivo: {str(e)}')
             raise UserError(f'Error al registrar dispositivo: {str(e)}')
     
     @api.model
-    def get_user_devices(self, user_id=None, current_device_id=None, **kwargs):
+    @api.readonly
+    def get_user_devices(self, user_id=None, current_device_id=None, requested_fields=None, **kwargs):
         """
         Obtiene todos los dispositivos de un usuario
         
         Args:
             user_id (int): ID del usuario (None = usuario actual)
             current_device_id (str): ID del dispositivo actual para marcarlo
+            requested_fields (list|str): Claves a devolver por dispositivo (None = todas)
             **kwargs: Argumentos adicionales desde JSON-RPC
             
         Returns:
@@ -499,13 +935,16 @@ class BiometricDevice(models.Model):
         ], order='last_used_at desc, enrolled_at desc')
         
         # Pasar current_device_id al contexto para identificar dispositivo actual
-        return [device.with_context(current_device_id=current_device_id)._format_device_data() for device in devices]
+        return devices.with_context(current_device_id=current_device_id)._format_devices_data(requested_fields)
     
     @api.model
     def validate_device(self, device_id=None, **kwargs):
         """
         Valida que un dispositivo esté activo y habilitado para autenticación biométrica.
         Usado por la app móvil para verificar si el dispositivo sigue autorizado.
+        Las revocaciones y cierres de sesión también se publican en el bus del usuario
+        (biometric/device_revoked, biometric/session_ended, ...), por lo que la app
+        suscrita solo necesita esta comprobación de forma esporádica.
         
         Args:
             device_id (str): ID único del dispositivo (generado por la app)
@@ -525,80 +964,239 @@ class BiometricDevice(models.Model):
                 'message': 'device_id es requerido'
             }
         
-        # Buscar dispositivo activo del usuario actual
+        # Buscar el dispositivo del usuario actual (único por usuario + device_id)
         device = self.search([
             ('user_id', '=', self.env.user.id),
-            ('device_id', '=', device_id),
-            ('state', '=', 'active'),
-            ('is_enabled', '=', True)
+            ('device_id', '=', device_id)
         ], limit=1)
         
-        if device:
+        return device._get_validation_result(device_id)
+    
+    def _get_validation_result(self, device_id):
+        """
+        Resultado de validación para el dispositivo ya buscado (vacío = no registrado)
+        
+        Args:
+            device_id (str): ID único del dispositivo (para el log)
+            
+        Returns:
+            dict: Mismo formato que validate_device
+        """
+        device = self[:1]
+        
+        if device and device.state == 'active' and device.is_enabled:
             _logger.info(f'Dispositivo validado: {device.device_name} para {self.env.user.name}')
             return {
                 'valid': True,
                 'device_odoo_id': device.id,
                 'message': 'Dispositivo válido'
             }
-        else:
-            # Verificar si existe pero está revocado/inactivo/deshabilitado
-            inactive_device = self.search([
-                ('user_id', '=', self.env.user.id),
-                ('device_id', '=', device_id)
-            ], limit=1)
-            
-            if inactive_device:
-                # Distinguir entre deshabilitado y revocado
-                if inactive_device.state == 'revoked':
-                    status_msg = 'revocado'
-                    can_reactivate = False
-                elif not inactive_device.is_enabled:
-                    status_msg = 'deshabilitado'
-                    can_reactivate = True
-                else:
-                    status_msg = inactive_device.state
-                    can_reactivate = inactive_device.state != 'revoked'
-                
-                _logger.warning(f'Dispositivo {status_msg}: {inactive_device.device_name}')
-                return {
-                    'valid': False,
-                    'device_odoo_id': inactive_device.id,
-                    'status': status_msg,
-                    'can_reactivate': can_reactivate,
-                    'message': f'Dispositivo {status_msg}. Acceso denegado.'
-                }
+        elif device:
+            # Existe pero está revocado/inactivo/deshabilitado
+            # Distinguir entre deshabilitado y revocado
+            if device.state == 'revoked':
+                status_msg = 'revocado'
+                can_reactivate = False
+            elif not device.is_enabled:
+                status_msg = 'deshabilitado'
+                can_reactivate = True
             else:
-                _logger.warning(f'Dispositivo no encontrado: {device_id}')
-                return {
-                    'valid': False,
-                    'device_odoo_id': None,
-                    'message': 'Dispositivo no registrado'
-                }
+                status_msg = device.state
+                can_reactivate = device.state != 'revoked'
+            
+            _logger.warning(f'Dispositivo {status_msg}: {device.device_name}')
+            return {
+                'valid': False,
+                'device_odoo_id': device.id,
+                'status': status_msg,
+                'can_reactivate': can_reactivate,
+                'message': f'Dispositivo {status_msg}. Acceso denegado.'
+            }
+        else:
+            _logger.warning(f'Dispositivo no encontrado: {device_id}')
+            return {
+                'valid': False,
+                'device_odoo_id': None,
+                'message': 'Dispositivo no registrado'
+            }
     
-    def _format_device_data(self):
-        """Formatea los datos del dispositivo para la API - Compatible con Frontend"""
-        self.ensure_one()
+    @api.model
+    def _parse_requested_fields(self, requested_fields):
+        """
+        Normaliza el parámetro ``fields`` de la API (lista o texto separado por comas).
+
+        Returns:
+            set|None: Claves solicitadas, o None si se deben devolver todas
+        """
+        if not requested_fields:
+            return None
+        if isinstance(requested_fields, str):
+            requested_fields = requested_fields.split(',')
+        keys = {str(key).strip() for key in requested_fields if key and str(key).strip()}
+        return keys or None
+
+    def _get_format_stats(self, requested_fields=None):
+        """
+        Precalcula authCount y hasActiveSession de varios dispositivos con una
+        consulta agrupada por clave (en lugar de dos consultas por dispositivo).
         
-        # Determinar si es el dispositivo actual (comparando device_id del contexto)
-        current_device_id = self.env.context.get('current_device_id')
-        is_current = (current_device_id == self.device_id) if current_device_id else False
+        Returns:
+            dict: {'auth_counts': {id: int}, 'active_sessions': set((device_id, user_id))}
+        """
+        requested_fields = self._parse_requested_fields(requested_fields)
+        AuthLog = self.env['biometric.auth.log']
+        stats = {}
         
-        # Forzar recálculo de auth_count
-        auth_logs = self.env['biometric.auth.log'].search([
-            ('device_id', '=', self.id),
-            ('success', '=', True)
-        ])
-        auth_count = len(auth_logs)
+        if requested_fields is None or 'authCount' in requested_fields:
+            stats['auth_counts'] = {
+                device.id: count
+                for device, count in AuthLog._read_group(
+                    [('device_id', 'in', self.ids), ('success', '=', True)],
+                    ['device_id'], ['__count'])
+            }
         
-        # 🆕 Verificar si hay sesiones activas en este dispositivo
-        active_sessions = self.env['biometric.auth.log'].search([
-            ('device_id', '=', self.id),
-            ('user_id', '=', self.user_id.id),
-            ('session_active', '=', True)
-        ], limit=1)
-        has_active_session = bool(active_sessions)
+        if requested_fields is None or 'hasActiveSession' in requested_fields:
+            stats['active_sessions'] = {
+                (device.id, user.id)
+                for device, user in AuthLog._read_group(
+                    [('device_id', 'in', self.ids), ('session_active', '=', True)],
+                    ['device_id', 'user_id'])
+            }
+        
+        return stats
+    
+    # ============================================
+    # CACHÉ DE PAYLOADS DE API
+    # ============================================
+    # authCount y hasActiveSession cuestan dos consultas sobre los logs y cambian
+    # poco: el payload completo se guarda por proceso y solo se valida su versión.
+    
+    def _get_payload_versions(self):
+        """
+        Versión de caché de cada dispositivo: (write_date, versión del resumen del
+        usuario, último evento pendiente en su buffer). Los cambios de logs y
+        sesiones incrementan la versión del resumen o agregan un evento al buffer.
         
+        Un dispositivo, resumen o evento de la transacción actual (fecha igual a la
+        de la transacción) no es cacheable: sus cambios aún podrían revertirse.
+        
+        Returns:
+            dict: {device_id: tuple} solo para los dispositivos cacheables
+        """
+        if not self:
+            return {}
+        self.env.cr.execute("""
+            SELECT user_id, version, write_date FROM biometric_user_summary
+            WHERE user_id = ANY(%s)
+        """, (list(set(self.user_id.ids)),))
+        summaries = {user_id: (version, write_date) for user_id, version, write_date in self.env.cr.fetchall()}
+        pending = self.env['biometric.user.summary']._get_pending_deltas(self.user_id.ids)
+        now = self.env.cr.now()
+        
+        versions = {}
+        for device in self:
+            summary_version, summary_date = summaries.get(device.user_id.id, (0, None))
+            user_pending = pending.get(device.user_id.id) or {}
+            if not device.write_date or device.write_date >= now:
+                continue
+            if summary_date and summary_date >= now:
+                continue
+            if user_pending.get('created_at') and user_pending['created_at'] >= now:
+                continue
+            versions[device.id] = (device.write_date, summary_version, user_pending.get('last_id'))
+        return versions
+    
+    def _get_last_use_values(self, pending=None):
+        """Claves de último uso del payload, con el uso pendiente del buffer si es posterior"""
+        self.ensure_one()
+        last_used_at = self.last_used_at
+        is_recently_used = self.is_recently_used
+        is_stale = self.is_stale
+        days_since_last_use = self.days_since_last_use
+        if pending and (not last_used_at or pending > last_used_at):
+            last_used_at = pending
+            is_recently_used = True
+            is_stale = False
+            days_since_last_use = 0
         return {
+            'lastUsedAt': last_used_at.isoformat() if last_used_at else None,
+            'isRecentlyUsed': is_recently_used,
+            'isStale': is_stale,
+            'daysSinceLastUse': max(0, days_since_last_use),  # Nunca negativo
+        }
+    
+    def _format_devices_data(self, requested_fields=None):
+        """
+        Formatea varios dispositivos: los payloads vigentes salen de la caché y
+        solo los demás comparten las consultas de estadísticas. isCurrentDevice
+        y el último uso se aplican en cada petición.
+        """
+        requested_fields = self._parse_requested_fields(requested_fields)
+        dbname = self.env.cr.dbname
+        versions = self._get_payload_versions()
+        
+        cached = {}
+        with _payload_cache_lock:
+            for device_id, version in versions.items():
+                entry = _payload_cache.get((dbname, device_id))
+                if entry and entry[0] == version:
+                    _payload_cache.move_to_end((dbname, device_id))
+                    cached[device_id] = entry[1]
+        
+        missing = self.filtered(lambda d: d.id not in cached)
+        stats = missing._get_format_stats(requested_fields) if missing else {}
+        if missing and requested_fields is None:
+            to_store = {}
+            for device in missing:
+                cached[device.id] = device._build_device_payload(None, stats)
+                if device.id in versions:
+                    to_store[(dbname, device.id)] = (versions[device.id], cached[device.id])
+            if to_store:
+                with _payload_cache_lock:
+                    _payload_cache.update(to_store)
+                    while len(_payload_cache) > DEVICE_PAYLOAD_CACHE_SIZE:
+                        _payload_cache.popitem(last=False)
+        
+        pending_last_used = self._get_pending_last_used()
+        current_device_id = self.env.context.get('current_device_id')
+        result = []
+        for device in self:
+            payload = cached.get(device.id) or device._build_device_payload(requested_fields, stats)
+            data = dict(payload)
+            data['isCurrentDevice'] = (current_device_id == device.device_id) if current_device_id else False
+            data.update(device._get_last_use_values(pending_last_used.get(device.id)))
+            if requested_fields is not None:
+                data = {key: value for key, value in data.items() if key == 'id' or key in requested_fields}
+            result.append(data)
+        return result
+    
+    def _format_device_data(self, requested_fields=None):
+        """
+        Formatea los datos del dispositivo para la API - Compatible con Frontend
+
+        Args:
+            requested_fields (list|str): Claves a devolver (None = todas). Las
+                claves costosas (authCount, hasActiveSession) solo se calculan
+                si se solicitan. ``id`` siempre se incluye.
+        """
+        self.ensure_one()
+        return self._format_devices_data(requested_fields)[0]
+    
+    def _build_device_payload(self, requested_fields, stats):
+        """
+        Payload del dispositivo sin las claves que dependen de la petición
+        (isCurrentDevice y último uso), que _format_devices_data completa.
+        
+        Args:
+            requested_fields (set|None): Claves solicitadas ya normalizadas (None = todas)
+            stats (dict): Estadísticas precalculadas por _get_format_stats
+        """
+        self.ensure_one()
+
+        def wanted(key):
+            return requested_fields is None or key in requested_fields
+        
+        data = {
             # Campos básicos
             'id': self.id,
             'deviceId': self.device_id,  # ← Frontend usa camelCase
@@ -615,24 +1213,415 @@ class BiometricDevice(models.Model):
             # Estado
             'state': self.state,
             'isEnabled': self.is_enabled,
-            'isCurrentDevice': is_current,  # ← Nuevo campo requerido
+            'isCurrentDevice': False,  # ← Se fija por petición
             
             # Fechas (ISO 8601)
             'enrolledAt': self.enrolled_at.isoformat() if self.enrolled_at else None,
-            'lastUsedAt': self.last_used_at.isoformat() if self.last_used_at else None,
+            'lastUsedAt': None,
+            
+            # Estadísticas (último uso: se fija por petición)
+            'isRecentlyUsed': False,
+            'isStale': False,
+            'daysSinceLastUse': 0,
+        }
+        
+        if wanted('authCount'):
+            # Precalculado en _get_format_stats
+            data['authCount'] = stats.get('auth_counts', {}).get(self.id, 0)
+        
+        if wanted('hasActiveSession'):
+            # 🆕 Si hay sesión activa en este dispositivo
+            data['hasActiveSession'] = (self.id, self.user_id.id) in stats.get('active_sessions', ())
+        
+        # 🆕 Detalles Adicionales (campos Text sin límite, solo si se piden)
+        if wanted('device_info_json'):
+            data['device_info_json'] = self.device_info_json
+        if wanted('notes'):
+            data['notes'] = self.notes
+        
+        return data
+    
+    # ============================================
+    # DESACTIVACIÓN AUTOMÁTICA DE DISPOSITIVOS INACTIVOS
+    # ============================================
+    
+    @api.model
+    def _cron_deactivate_stale(self, batch_size=STALE_BATCH_SIZE):
+        """
+        Pasa a 'inactive' los dispositivos activos sin uso por más de
+        ``biometric.device.stale.days`` días.
+        
+        Recorre por id (keyset) en lotes: cada lote es un único UPDATE con
+        SKIP LOCKED (las filas en uso se toman en la siguiente ejecución), sus notas
+        de chatter se crean en bloque y se confirma por separado. Así no se toman
+        locks largos ni se excede el tiempo límite del worker.
+        """
+        cr = self.env.cr
+        stale_days = self._get_stale_days()
+        if stale_days <= 0:
+            return
+        
+        # El último uso pendiente en el buffer cuenta como uso
+        self._flush_activity_buffer()
+        cr.commit()
+        
+        limit_date = fields.Datetime.now() - timedelta(days=stale_days)
+        note_subtype_id = self.env['ir.model.data']._xmlid_to_res_id('mail.mt_note')
+        body = f'Dispositivo desactivado automáticamente: sin uso por más de {stale_days} días.'
+        last_id = 0
+        deactivated = 0
+        
+        while True:
+            cr.execute("""
+                UPDATE biometric_device
+                SET state = 'inactive',
+                    is_stale = TRUE,
+                    write_date = now() AT TIME ZONE 'UTC',
+                    write_uid = %(uid)s
+                WHERE id IN (
+                    SELECT id FROM biometric_device
+                    WHERE state = 'active'
+                      AND id > %(last_id)s
+                      AND COALESCE(last_used_at, enrolled_at) < %(limit_date)s
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id
+            """, {'uid': self.env.uid, 'last_id': last_id, 'limit_date': limit_date, 'batch_size': batch_size})
+            rows = cr.fetchall()
+            if not rows:
+                break
+            device_ids = [device_id for device_id, _user_id in rows]
+            self.env['biometric.user.summary'].sudo()._refresh_device_counts(
+                {user_id for _device_id, user_id in rows}
+            )
             
-            # Estadísticas
-            'authCount': auth_count,  # Recalculado en tiempo real
-            'isRecentlyUsed': self.is_recently_used,
-            'isStale': self.is_stale,
-            'daysSinceLastUse': max(0, self.days_since_last_use),  # Nunca negativo
+            self.env['mail.message'].sudo().create([{
+                'model': self._name,
+                'res_id': device_id,
+                'message_type': 'notification',
+                'subtype_id': note_subtype_id,
+                'body': body,
+            } for device_id in device_ids])
             
-            # 🆕 Estado de sesión
-            'hasActiveSession': has_active_session,  # Si hay sesión activa en este dispositivo
+            self.invalidate_model(['state', 'is_stale', 'write_date', 'write_uid'])
+            self.browse(device_ids)._bus_notify(BUS_DEVICE_DEACTIVATED, reason='stale')
             
-            # 🆕 Detalles Adicionales
-            'device_info_json': self.device_info_json,
-            'notes': self.notes,
+            last_id = max(device_ids)
+            deactivated += len(device_ids)
+            cr.commit()
+        
+        if deactivated:
+            _logger.info(f'Dispositivos desactivados por inactividad (> {stale_days} días): {deactivated}')
+    
+    # ============================================
+    # MIGRACIÓN DE device_info_json (TEXT) A JSONB
+    # ============================================
+    
+    @api.model
+    def _cron_backfill_device_info(self, batch_size=DEVICE_INFO_BACKFILL_BATCH):
+        """
+        Cron de respaldo de la migración (la hace migrations/1.1.0/post-migrate.py):
+        completa lo que quede y se desactiva cuando la columna legada ya no existe.
+        """
+        migrated = self._backfill_device_info(batch_size)
+        if not column_exists(self.env.cr, self._table, 'device_info_json'):
+            self.env['ir.cron']._notify_progress(done=migrated, remaining=0, deactivate=True)
+    
+    @api.model
+    def _backfill_device_info(self, batch_size=DEVICE_INFO_BACKFILL_BATCH, commit=True):
+        """
+        Migra por lotes el JSON legado (columna de texto device_info_json) a device_info
+        y elimina la columna al terminar.
+        
+        Cada lote se recorre por id (keyset), se actualiza con un único UPDATE y se
+        confirma por separado (commit=False en la migración del módulo); la columna de
+        texto se vacía al migrar, por lo que el proceso es reanudable.
+        
+        Returns:
+            int: Dispositivos migrados
+        """
+        cr = self.env.cr
+        if not column_exists(cr, self._table, 'device_info_json'):
+            return 0
+        
+        last_id = 0
+        migrated = 0
+        while True:
+            cr.execute("""
+                SELECT id, device_info_json FROM biometric_device
+                WHERE device_info_json IS NOT NULL AND id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            
+            values = []
+            for device_id, raw in rows:
+                info = self._parse_device_info(raw)
+                columns = self._extract_device_info_columns(info)
+                values.append((
+                    device_id,
+                    json.dumps(info) if info is not None else None,
+                    columns['manufacturer'] or None,
+                    columns['os_api_level'] or None,
+                    columns['app_version'] or None,
+                    columns['security_patch'] or None,
+                ))
+            
+            execute_values(cr._obj, """
+                UPDATE biometric_device AS d
+                SET device_info = COALESCE(d.device_info, v.info::jsonb),
+                    manufacturer = COALESCE(d.manufacturer, v.manufacturer),
+                    os_api_level = COALESCE(d.os_api_level, v.os_api_level::integer),
+                    app_version = COALESCE(d.app_version, v.app_version),
+                    security_patch = COALESCE(d.security_patch, v.security_patch),
+                    device_info_json = NULL
+                FROM (VALUES %s) AS v (id, info, manufacturer, os_api_level, app_version, security_patch)
+                WHERE d.id = v.id
+            """, values)
+            
+            last_id = rows[-1][0]
+            migrated += len(rows)
+            if commit:
+                cr.commit()
+        
+        if migrated:
+            self.invalidate_model()
+            _logger.info(f'device_info migrado a JSONB: {migrated} dispositivos')
+        
+        # El campo ya no es almacenado: sin filas pendientes la columna sobra. El
+        # DROP espera un lock exclusivo de la tabla; si no lo obtiene pronto se
+        # reintenta en la siguiente ejecución en lugar de frenar las peticiones.
+        try:
+            with cr.savepoint():
+                cr.execute("SET LOCAL lock_timeout = '5s'")
+                cr.execute('ALTER TABLE biometric_device DROP COLUMN device_info_json')
+        except LockNotAvailable:
+            _logger.info('Columna device_info_json en uso; se eliminará en la próxima ejecución')
+        else:
+            _logger.info('Columna legada device_info_json eliminada')
+        cr.execute('SET LOCAL lock_timeout TO DEFAULT')
+        return migrated
+    
+    # ============================================
+    # ARRANQUE DE LA APP
+    # ============================================
+    
+    @api.model
+    def get_bootstrap_data(self, device_id=None, history_limit=20, device_fields=None,
+                           log_fields=None, **kwargs):
+        """
+        Todo lo que la app necesita al arrancar, en una sola llamada:
+        validación del dispositivo, dispositivo actual, lista de dispositivos,
+        sesiones activas y primera página del historial.
+        
+        Los dispositivos del usuario se leen una sola vez y sus estadísticas se
+        calculan con consultas agrupadas compartidas por la validación, el
+        dispositivo actual y la lista.
+        
+        Args:
+            device_id (str): ID único del dispositivo desde donde arranca la app
+            history_limit (int): Registros de la primera página del historial
+            device_fields (list|str): Claves a devolver por dispositivo (None = todas)
+            log_fields (list|str): Claves a devolver por log (None = todas)
+            
+        Returns:
+            dict: {validation, current_device, devices, active_sessions, history}
+        """
+        devices = self.search([
+            ('user_id', '=', self.env.user.id)
+        ], order='last_used_at desc, enrolled_at desc')
+        
+        current = devices.filtered(lambda d: d.device_id == device_id)[:1] if device_id else self
+        if device_id:
+            validation = current._get_validation_result(device_id)
+        else:
+            validation = {
+                'valid': False,
+                'device_odoo_id': None,
+                'message': 'device_id es requerido'
+            }
+        
+        # Solo se actualiza el último uso de un dispositivo válido
+        if validation['valid']:
+            current.update_last_used()
+        
+        listed = devices.filtered(lambda d: d.state != 'revoked')
+        to_format = (listed | current).with_context(current_device_id=device_id)
+        formatted = dict(zip(to_format.ids, to_format._format_devices_data(device_fields)))
+        
+        AuthLog = self.env['biometric.auth.log']
+        return {
+            'validation': validation,
+            'current_device': formatted.get(current.id) if current else None,
+            'devices': [formatted[device.id] for device in listed],
+            'active_sessions': AuthLog.get_active_sessions(),
+            'history': AuthLog.get_user_auth_history(limit=history_limit, requested_fields=log_fields),
+        }
+    
+    # ============================================
+    # SINCRONIZACIÓN DELTA
+    # ============================================
+    
+    @api.model
+    def _encode_sync_watermark(self, timestamp, log_id=0):
+        """Codifica el watermark opaco (write_date + id del último log entregado)"""
+        raw = f'{timestamp.isoformat()}|{log_id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @api.model
+    def _decode_sync_watermark(self, watermark):
+        """
+        Decodifica un watermark emitido por el servidor
+        
+        Returns:
+            tuple|None: (datetime, log_id) o None si no hay watermark o es inválido
+        """
+        if not watermark:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(watermark.encode()).decode()
+            timestamp, log_id = raw.split('|')
+            return datetime.fromisoformat(timestamp), int(log_id)
+        except Exception:
+            _logger.warning(f'Watermark de sincronización inválido: {watermark}')
+            return None
+    
+    @api.model
+    def get_sync_changes(self, watermark=None, current_device_id=None, limit=SYNC_LOG_LIMIT,
+                         device_fields=None, log_fields=None, **kwargs):
+        """
+        Devuelve los cambios de dispositivos y logs del usuario actual desde un watermark.
+        
+        Sin watermark (o con uno inválido) se hace una sincronización completa: todos los
+        dispositivos vigentes y la primera página del historial. Los clientes deben aplicar
+        los registros como upserts por ``id``: un mismo dispositivo puede llegar en dos
+        sincronizaciones consecutivas.
+        
+        El watermark nunca supera el inicio de la transacción de cliente abierta más
+        antigua (_get_sync_horizon). Horizonte y datos usan un mismo cursor nuevo: el
+        horizonte se consulta en su propia transacción y los datos en la siguiente,
+        con un snapshot posterior, así que los logs anteriores al horizonte ya están
+        todos confirmados cuando se entregan.
+        
+        Args:
+            watermark (str): Watermark devuelto por la sincronización anterior
+            current_device_id (str): ID del dispositivo actual para marcarlo
+            limit (int): Máximo de logs a devolver
+            device_fields (list|str): Claves a devolver por dispositivo (None = todas)
+            log_fields (list|str): Claves a devolver por log (None = todas)
+            
+        Returns:
+            dict: {watermark, full_sync, devices, removed_devices, logs, has_more}
+        """
+        with self.env.registry.cursor() as cr:
+            sync_self = self.with_env(self.env(cr=cr))
+            horizon = sync_self._get_sync_horizon()
+            cr.commit()
+            return sync_self._read_sync_changes(
+                horizon, watermark, current_device_id, limit, device_fields, log_fields,
+            )
+    
+    @api.model
+    def _get_sync_horizon(self):
+        """
+        Límite superior del watermark: inicio de la transacción de cliente abierta
+        más antigua de la base (o el instante actual si no hay ninguna).
+        
+        write_date es el inicio de la transacción que escribió, no su commit: una
+        transacción larga puede confirmar filas con un write_date anterior a
+        cualquier margen fijo. Toda fila anterior al horizonte viene de una
+        transacción ya terminada, siempre que los datos se lean con un snapshot
+        tomado después de esta consulta. Autovacuum, walsenders y la propia conexión
+        no escriben logs y no cuentan; por eso tampoco deben quedar cursores de
+        cliente abiertos durante mucho tiempo en el primario.
+        """
+        self.env.cr.execute("""
+            SELECT LEAST(clock_timestamp(), min(xact_start)) AT TIME ZONE 'UTC'
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+              AND backend_type = 'client backend'
+              AND pid <> pg_backend_pid()
+              AND xact_start IS NOT NULL
+        """)
+        return self.env.cr.fetchone()[0]
+    
+    @api.model
+    def _read_sync_changes(self, horizon, watermark, current_device_id, limit, device_fields, log_fields):
+        """Lectura de get_sync_changes (en un cursor abierto después de calcular el horizonte)"""
+        user_id = self.env.user.id
+        limit = max(1, min(int(limit or SYNC_LOG_LIMIT), SYNC_LOG_LIMIT))
+        since = self._decode_sync_watermark(watermark)
+        full_sync = since is None
+        
+        AuthLog = self.env['biometric.auth.log']
+        
+        # --- Dispositivos modificados ---
+        if full_sync:
+            self.env.cr.execute(
+                'SELECT id FROM biometric_device WHERE user_id = %s',
+                (user_id,)
+            )
+        else:
+            # >= : reenviar un dispositivo ya entregado es inocuo, perderlo no
+            self.env.cr.execute(
+                'SELECT id FROM biometric_device WHERE user_id = %s AND write_date >= %s',
+                (user_id, since[0])
+            )
+        devices = self.with_context(active_test=False).browse([row[0] for row in self.env.cr.fetchall()])
+        
+        live_devices = devices.filtered(lambda d: d.active and d.state != 'revoked')
+        removed_devices = [] if full_sync else [{
+            'id': device.id,
+            'deviceId': device.device_id,
+            'reason': 'revoked' if device.state == 'revoked' else 'archived',
+        } for device in devices - live_devices]
+        
+        # --- Dispositivos eliminados ---
+        if not full_sync:
+            tombstones = self.env['biometric.device.tombstone'].sudo().search([
+                ('user_id', '=', user_id),
+                ('removed_at', '>=', since[0]),
+            ])
+            removed_devices += [{
+                'id': tombstone.device_ref,
+                'deviceId': tombstone.device_id,
+                'reason': 'deleted',
+            } for tombstone in tombstones]
+        
+        # --- Logs ---
+        next_mark = (horizon, 0)
+        has_more = False
+        if full_sync:
+            # Primera página del historial; los cambios siguientes llegan por delta
+            logs = AuthLog.search([('user_id', '=', user_id)], order='auth_date desc', limit=limit)
+        else:
+            self.env.cr.execute("""
+                SELECT id, write_date FROM biometric_auth_log
+                WHERE user_id = %s AND (write_date, id) > (%s, %s) AND write_date < %s
+                ORDER BY write_date, id
+                LIMIT %s
+            """, (user_id, since[0], since[1], horizon, limit + 1))
+            rows = self.env.cr.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            logs = AuthLog.browse([row[0] for row in rows])
+            if has_more:
+                # Continuar exactamente después del último log entregado
+                next_mark = (rows[-1][1], rows[-1][0])
+            next_mark = max(next_mark, since)
+        
+        return {
+            'watermark': self._encode_sync_watermark(*next_mark),
+            'full_sync': full_sync,
+            'devices': live_devices.with_context(current_device_id=current_device_id)._format_devices_data(device_fields),
+            'removed_devices': removed_devices,
+            'logs': logs._format_history_data(log_fields),
+            'has_more': has_more,
         }
     
     @api.model
@@ -689,6 +1678,8 @@ class BiometricDevice(models.Model):
                 'message': 'Dispositivo reactivado correctamente'
             }
             
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error reactivando dispositivo: {str(e)}')
             return {
@@ -744,6 +1735,8 @@ class BiometricDevice(models.Model):
                 # Crear nuevo dispositivo
                 return self.register_device(device_data)
                 
+        except PG_CONCURRENCY_EXCEPTIONS_TO_RETRY:
+            raise  # Odoo reintenta la petición completa
         except Exception as e:
             _logger.error(f'Error en get_or_create_device: {str(e)}')
             return {
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.tools import create_unique_index
+from .biometric_auth_error import lookup_fingerprint
+
+
+class BiometricDeviceSnapshot(models.Model):
+    _name = 'biometric.device.snapshot'
+    _description = 'Datos de Dispositivo en Logs'
+    _order = 'name, id'
+
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    name = fields.Char(
+        string='Nombre Dispositivo',
+        readonly=True
+    )
+    
+    platform = fields.Char(
+        string='Plataforma',
+        readonly=True
+    )
+    
+    fingerprint = fields.Char(
+        string='Huella',
+        required=True,
+        readonly=True,
+        help='md5 de nombre y plataforma: una fila por combinación distinta'
+    )
+    
+    def init(self):
+        create_unique_index(
+            self._cr,
+            'biometric_device_snapshot_fingerprint_idx',
+            self._table,
+            ['fingerprint'],
+        )
+    
+    @api.model
+    def _get_snapshot_id(self, name, platform):
+        """
+        ID del snapshot para (nombre, plataforma), creándolo si no existe.
+        
+        Returns:
+            int|bool: ID del snapshot (False si no hay nombre ni plataforma)
+        """
+        if not name and not platform:
+            return False
+        fingerprint = lookup_fingerprint(name, platform)
+        cr = self.env.cr
+        cr.execute('SELECT id FROM biometric_device_snapshot WHERE fingerprint = %s', (fingerprint,))
+        row = cr.fetchone()
+        if not row:
+            cr.execute("""
+                INSERT INTO biometric_device_snapshot
+                    (name, platform, fingerprint, create_uid, create_date, write_uid, write_date)
+                VALUES (%(name)s, %(platform)s, %(fingerprint)s,
+                        %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC')
+                ON CONFLICT (fingerprint) DO NOTHING
+                RETURNING id
+            """, {'name': name or None, 'platform': platform or None, 'fingerprint': fingerprint, 'uid': self.env.uid})
+            row = cr.fetchone()
+            if not row:
+                cr.execute('SELECT id FROM biometric_device_snapshot WHERE fingerprint = %s', (fingerprint,))
+                row = cr.fetchone()
+        return row[0]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+from odoo.tools import create_index
+
+
+class BiometricDeviceTombstone(models.Model):
+    _name = 'biometric.device.tombstone'
+    _description = 'Dispositivo Eliminado (Sincronización)'
+    _order = 'removed_at desc'
+
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        required=True,
+        ondelete='cascade',
+        help='Usuario propietario del dispositivo eliminado'
+    )
+    
+    device_ref = fields.Integer(
+        string='ID Registro',
+        required=True,
+        help='ID en Odoo del dispositivo eliminado'
+    )
+    
+    device_id = fields.Char(
+        string='ID Dispositivo',
+        help='Identificador único del dispositivo (generado por la app)'
+    )
+    
+    removed_at = fields.Datetime(
+        string='Fecha Eliminación',
+        required=True,
+        default=fields.Datetime.now
+    )
+    
+    def init(self):
+        # La sincronización delta consulta por usuario y fecha de eliminación
+        create_index(
+            self._cr,
+            'biometric_device_tombstone_user_removed_idx',
+            self._table,
+            ['user_id', 'removed_at'],
+        )
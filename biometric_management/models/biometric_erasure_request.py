@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import column_exists
+from .biometric_auth_log import BUS_SESSION_ENDED, SQL_LOG_DEVICE_PLATFORM, LEGACY_DEVICE_COLUMNS
+from .biometric_device import BUS_DEVICE_REVOKED
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Filas por lote (y por commit) en cada fase del borrado
+ERASURE_BATCH_SIZE = 2000
+# Lotes procesados por ejecución del cron; si quedan más, el cron se vuelve a disparar
+ERASURE_BATCHES_PER_RUN = 50
+# Copias de texto legadas del dispositivo en los logs (se vacían al anonimizar)
+LEGACY_LOG_DEVICE_COLUMNS = LEGACY_DEVICE_COLUMNS + ('device_name_direct', 'device_platform_direct')
+
+# Orden de las fases: una fase no empieza hasta que la anterior no tiene filas pendientes
+ERASURE_PHASES = ['sessions', 'logs', 'stats', 'devices', 'cleanup', 'done']
+
+
+class BiometricErasureRequest(models.Model):
+    _name = 'biometric.erasure.request'
+    _description = 'Borrado de Datos Biométricos (RGPD)'
+    _order = 'id desc'
+    _rec_name = 'user_login'
+    
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        ondelete='set null',
+        help='Usuario cuyos datos biométricos se eliminan'
+    )
+    
+    # Copias para la auditoría: el registro se conserva aunque el usuario se elimine
+    user_ref = fields.Integer(
+        string='ID Usuario',
+        readonly=True
+    )
+    
+    user_login = fields.Char(
+        string='Login',
+        readonly=True
+    )
+    
+    mode = fields.Selection([
+        ('delete', 'Eliminar'),
+        ('anonymize', 'Anonimizar')
+    ], string='Modo', required=True, default='delete',
+        help='Eliminar: se borran dispositivos, historial y estadísticas del usuario.\n'
+             'Anonimizar: los dispositivos se borran igual, pero el historial y las '
+             'estadísticas se conservan sin datos personales, a nombre del usuario público.')
+    
+    reason = fields.Text(
+        string='Motivo'
+    )
+    
+    # ============================================
+    # ESTADO Y PROGRESO
+    # ============================================
+    
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('pending', 'En Cola'),
+        ('running', 'En Proceso'),
+        ('done', 'Completado'),
+        ('failed', 'Fallido')
+    ], string='Estado', default='draft', required=True, readonly=True)
+    
+    phase = fields.Selection([
+        ('sessions', 'Sesiones'),
+        ('logs', 'Historial'),
+        ('stats', 'Estadísticas'),
+        ('devices', 'Dispositivos'),
+        ('cleanup', 'Datos Derivados'),
+        ('done', 'Finalizado')
+    ], string='Fase', default='sessions', required=True, readonly=True)
+    
+    last_id = fields.Integer(
+        string='Cursor',
+        readonly=True,
+        help='Último ID procesado en la fase actual (permite continuar tras una interrupción)'
+    )
+    
+    log_total = fields.Integer(
+        string='Logs a Procesar',
+        readonly=True
+    )
+    
+    device_total = fields.Integer(
+        string='Dispositivos a Procesar',
+        readonly=True
+    )
+    
+    sessions_ended = fields.Integer(
+        string='Sesiones Finalizadas',
+        readonly=True
+    )
+    
+    logs_processed = fields.Integer(
+        string='Logs Procesados',
+        readonly=True
+    )
+    
+    devices_deleted = fields.Integer(
+        string='Dispositivos Eliminados',
+        readonly=True
+    )
+    
+    messages_deleted = fields.Integer(
+        string='Mensajes Eliminados',
+        readonly=True
+    )
+    
+    progress = fields.Float(
+        string='Progreso (%)',
+        compute='_compute_progress'
+    )
+    
+    started_at = fields.Datetime(
+        string='Iniciado',
+        readonly=True
+    )
+    
+    done_at = fields.Datetime(
+        string='Finalizado',
+        readonly=True
+    )
+    
+    last_error = fields.Text(
+        string='Último Error',
+        readonly=True
+    )
+    
+    @api.depends('state', 'log_total', 'device_total', 'logs_processed', 'devices_deleted')
+    def _compute_progress(self):
+        for record in self:
+            if record.state == 'done':
+                record.progress = 100.0
+                continue
+            total = record.log_total + record.device_total
+            done = min(record.logs_processed + record.devices_deleted, total)
+            record.progress = 100.0 * done / total if total else 0.0
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Guarda las copias de auditoría del usuario"""
+        users = self.env['res.users'].browse([vals.get('user_id') for vals in vals_list if vals.get('user_id')])
+        logins = {user.id: user.login for user in users}
+        for vals in vals_list:
+            if vals.get('user_id'):
+                vals.setdefault('user_ref', vals['user_id'])
+                vals.setdefault('user_login', logins.get(vals['user_id']))
+        return super(BiometricErasureRequest, self).create(vals_list)
+    
+    def unlink(self):
+        """Las solicitudes iniciadas son el registro de auditoría del borrado"""
+        if any(record.state != 'draft' for record in self):
+            raise UserError('Solo se pueden eliminar solicitudes de borrado en borrador.')
+        return super(BiometricErasureRequest, self).unlink()
+    
+    # ============================================
+    # ACCIONES
+    # ============================================
+    
+    def action_start(self):
+        """Encola el borrado y despierta al worker"""
+        cr = self.env.cr
+        for record in self.filtered(lambda r: r.state == 'draft'):
+            if not record.user_id:
+                raise UserError('La solicitud no tiene usuario.')
+            if record.user_id == self.env.ref('base.public_user'):
+                raise UserError('No se pueden borrar los datos del usuario público.')
+            if self.search_count([
+                ('user_ref', '=', record.user_ref),
+                ('state', 'in', ('pending', 'running')),
+            ]):
+                raise UserError(f'Ya hay un borrado en curso para {record.user_login}.')
+            
+            # Totales para mostrar el progreso (conteos resueltos con los índices por usuario)
+            cr.execute('SELECT count(*) FROM biometric_auth_log WHERE user_id = %s', (record.user_ref,))
+            log_total = cr.fetchone()[0]
+            cr.execute('SELECT count(*) FROM biometric_device WHERE user_id = %s', (record.user_ref,))
+            device_total = cr.fetchone()[0]
+            
+            record.write({
+                'state': 'pending',
+                'phase': ERASURE_PHASES[0],
+                'last_id': 0,
+                'log_total': log_total,
+                'device_total': device_total,
+                'started_at': fields.Datetime.now(),
+                'last_error': False,
+            })
+            _logger.warning(
+                f'Borrado biométrico solicitado para {record.user_login} (modo {record.mode}) '
+                f'por {self.env.user.login}'
+            )
+        
+        self.env.ref('biometric_management.cron_biometric_erasure_runner').sudo()._trigger()
+    
+    def action_retry(self):
+        """Reanuda los borrados fallidos desde la fase y el cursor guardados"""
+        self.filtered(lambda r: r.state == 'failed').write({'state': 'pending', 'last_error': False})
+        self.env.ref('biometric_management.cron_biometric_erasure_runner').sudo()._trigger()
+    
+    # ============================================
+    # EJECUCIÓN (CRON)
+    # ============================================
+    
+    @api.model
+    def _cron_process_erasures(self, max_batches=ERASURE_BATCHES_PER_RUN):
+        """
+        Worker: avanza los borrados pendientes de a un lote, con commit por lote.
+        
+        La fase y el cursor se guardan en la misma transacción que el lote, por lo
+        que una ejecución interrumpida (tiempo límite, reinicio) continúa donde quedó.
+        Si se agota el cupo de lotes, el cron se vuelve a disparar.
+        """
+        cr = self.env.cr
+        processed = 0
+        
+        while processed < max_batches:
+            cr.execute("""
+                SELECT id FROM biometric_erasure_request
+                WHERE state IN ('pending', 'running')
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            row = cr.fetchone()
+            if not row:
+                return
+            
+            self.browse(row[0])._run_batch()
+            cr.commit()
+            processed += 1
+        
+        self.env.ref('biometric_management.cron_biometric_erasure_runner')._trigger()
+    
+    def _run_batch(self, batch_size=ERASURE_BATCH_SIZE):
+        """Procesa un lote de la fase actual; si falla, la solicitud queda para reintentar"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                vals = getattr(self, f'_erase_{self.phase}')(batch_size)
+                if vals is None:
+                    next_phase = ERASURE_PHASES[ERASURE_PHASES.index(self.phase) + 1]
+                    vals = {'phase': next_phase, 'last_id': 0}
+                    if next_phase == 'done':
+                        vals.update(state='done', done_at=fields.Datetime.now())
+                        _logger.warning(
+                            f'Borrado biométrico completado para {self.user_login}: '
+                            f'{self.logs_processed} logs, {self.devices_deleted} dispositivos'
+                        )
+                vals.setdefault('state', 'running')
+                self.write(vals)
+        except Exception as e:
+            self.env.invalidate_all(flush=False)
+            _logger.error(f'Borrado biométrico {self.id} ({self.user_login}) falló en la fase {self.phase}: {e}')
+            self.write({'state': 'failed', 'last_error': str(e)})
+    
+    # ============================================
+    # FASES
+    # ============================================
+    # Cada fase devuelve los valores de progreso del lote procesado, o None
+    # cuando ya no le quedan filas (se pasa a la siguiente).
+    
+    def _erase_sessions(self, batch_size):
+        """Finaliza en bloque las sesiones activas del usuario y avisa a la app"""
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE biometric_auth_log
+            SET session_active = FALSE,
+                session_ended_at = now() AT TIME ZONE 'UTC'
+            WHERE id IN (
+                SELECT id FROM biometric_auth_log
+                WHERE user_id = %s AND session_active AND id > %s
+                ORDER BY id
+                LIMIT %s
+            )
+            RETURNING id
+        """, (self.user_ref, self.last_id, batch_size))
+        log_ids = [log_id for log_id, in cr.fetchall()]
+        if not log_ids:
+            return None
+        
+        logs = self.env['biometric.auth.log'].sudo().browse(log_ids)
+        logs.invalidate_recordset(['session_active', 'session_ended_at'])
+        logs._bus_notify(BUS_SESSION_ENDED)
+        return {
+            'last_id': max(log_ids),
+            'sessions_ended': self.sessions_ended + len(log_ids),
+        }
+    
+    def _erase_logs(self, batch_size):
+        """Elimina o anonimiza un lote del historial de autenticaciones"""
+        cr = self.env.cr
+        if self.mode == 'delete':
+            cr.execute("""
+                DELETE FROM biometric_auth_log
+                WHERE id IN (
+                    SELECT id FROM biometric_auth_log
+                    WHERE user_id = %s AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                )
+                RETURNING id
+            """, (self.user_ref, self.last_id, batch_size))
+            log_ids = [log_id for log_id, in cr.fetchall()]
+        else:
+            log_ids = self._anonymize_logs(batch_size)
+        
+        if not log_ids:
+            return None
+        self.env['biometric.auth.log'].invalidate_model()
+        return {
+            'last_id': max(log_ids),
+            'logs_processed': self.logs_processed + len(log_ids),
+        }
+    
+    def _anonymize_logs(self, batch_size):
+        """
+        Pasa un lote de logs al usuario público y quita los datos personales.
+        
+        Se conservan fecha, tipo, resultado, error y duración (las estadísticas
+        siguen cuadrando); el dispositivo se reduce a un snapshot solo con la
+        plataforma, porque el nombre suele identificar a la persona.
+        """
+        cr = self.env.cr
+        cr.execute(f"""
+            SELECT l.id, {SQL_LOG_DEVICE_PLATFORM}
+            FROM biometric_auth_log l
+            LEFT JOIN biometric_device d ON d.id = l.device_id
+            LEFT JOIN biometric_device_snapshot s ON s.id = l.device_snapshot_id
+            WHERE l.user_id = %s AND l.id > %s
+            ORDER BY l.id
+            LIMIT %s
+        """, (self.user_ref, self.last_id, batch_size))
+        rows = cr.fetchall()
+        
+        by_platform = {}
+        for log_id, platform in rows:
+            by_platform.setdefault(platform, []).append(log_id)
+        
+        legacy_columns = [
+            column for column in LEGACY_LOG_DEVICE_COLUMNS
+            if column_exists(cr, 'biometric_auth_log', column)
+        ]
+        legacy_sql = ''.join(f', {column} = NULL' for column in legacy_columns)
+        snapshot_model = self.env['biometric.device.snapshot'].sudo()
+        public_user_id = self.env.ref('base.public_user').id
+        
+        for platform, log_ids in by_platform.items():
+            snapshot_id = snapshot_model._get_snapshot_id(False, platform) if platform != 'unknown' else None
+            cr.execute(f"""
+                UPDATE biometric_auth_log
+                SET user_id = %(public_user_id)s,
+                    device_id = NULL,
+                    device_snapshot_id = %(snapshot_id)s,
+                    ip_address = NULL,
+                    user_agent = NULL,
+                    session_id = NULL,
+                    notes = NULL,
+                    session_active = FALSE,
+                    name = 'Anónimo - ' || CASE WHEN success THEN 'Exitoso' ELSE 'Fallido' END
+                           || ' - ' || to_char(auth_date, 'YYYY-MM-DD HH24:MI:SS'),
+                    write_date = now() AT TIME ZONE 'UTC',
+                    write_uid = %(uid)s
+                    {legacy_sql}
+                WHERE id = ANY(%(log_ids)s)
+            """, {
+                'public_user_id': public_user_id,
+                'snapshot_id': snapshot_id,
+                'uid': self.env.uid,
+                'log_ids': log_ids,
+            })
+        return [log_id for log_id, _platform in rows]
+    
+    def _erase_stats(self, batch_size):
+        """
+        Estadísticas diarias del usuario (un solo paso). Va antes de borrar los
+        dispositivos: con sus filas aún presentes, el SET NULL de device_id
+        chocaría en la clave única de dos dispositivos del mismo día y plataforma.
+        """
+        cr = self.env.cr
+        user_id = self.user_ref
+        
+        if self.mode == 'anonymize':
+            # Las filas del usuario se suman a las del usuario público (misma clave de agregación)
+            cr.execute("""
+                INSERT INTO biometric_auth_stats_daily AS t (
+                    day, user_id, device_id, platform, auth_type,
+                    attempt_count, success_count, failure_count,
+                    duration_ms_sum, duration_count,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT day, %(public_user_id)s, NULL, platform, auth_type,
+                       sum(attempt_count), sum(success_count), sum(failure_count),
+                       sum(duration_ms_sum), sum(duration_count),
+                       %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM biometric_auth_stats_daily
+                WHERE user_id = %(user_id)s
+                GROUP BY day, platform, auth_type
+                ON CONFLICT (day, user_id, COALESCE(device_id, 0), COALESCE(platform, ''), auth_type)
+                DO UPDATE SET
+                    attempt_count = t.attempt_count + EXCLUDED.attempt_count,
+                    success_count = t.success_count + EXCLUDED.success_count,
+                    failure_count = t.failure_count + EXCLUDED.failure_count,
+                    duration_ms_sum = t.duration_ms_sum + EXCLUDED.duration_ms_sum,
+                    duration_count = t.duration_count + EXCLUDED.duration_count,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+            """, {
+                'public_user_id': self.env.ref('base.public_user').id,
+                'user_id': user_id,
+                'uid': self.env.uid,
+            })
+        
+        cr.execute('DELETE FROM biometric_auth_stats_daily WHERE user_id = %s', (user_id,))
+        self.env['biometric.auth.stats.daily'].invalidate_model()
+        return None
+    
+    def _erase_devices(self, batch_size):
+        """Elimina un lote de dispositivos del usuario con su chatter y su actividad pendiente"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT id FROM biometric_device
+            WHERE user_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (self.user_ref, self.last_id, batch_size))
+        device_ids = [device_id for device_id, in cr.fetchall()]
+        if not device_ids:
+            return None
+        
+        # La app cierra la sesión biométrica al recibir la revocación
+        devices = self.env['biometric.device'].sudo().with_context(active_test=False).browse(device_ids)
+        devices._bus_notify(BUS_DEVICE_REVOKED, reason='erasure')
+        
+        # Adjuntos por ORM para que sus archivos se liberen del filestore
+        self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'biometric.device'),
+            ('res_id', 'in', device_ids),
+        ]).unlink()
+        
+        cr.execute("""
+            DELETE FROM mail_message
+            WHERE model = 'biometric.device' AND res_id = ANY(%s)
+        """, (device_ids,))
+        messages_deleted = cr.rowcount
+        cr.execute("""
+            DELETE FROM mail_followers
+            WHERE res_model = 'biometric.device' AND res_id = ANY(%s)
+        """, (device_ids,))
+        cr.execute("""
+            DELETE FROM mail_activity
+            WHERE res_model = 'biometric.device' AND res_id = ANY(%s)
+        """, (device_ids,))
+        # Filas de otros usuarios sobre estos dispositivos (raro): fusionadas como en unlink()
+        self.env['biometric.auth.stats.daily'].sudo()._detach_devices(device_ids)
+        cr.execute('DELETE FROM biometric_device_activity WHERE device_id = ANY(%s)', (device_ids,))
+        cr.execute('DELETE FROM biometric_device WHERE id = ANY(%s)', (device_ids,))
+        
+        for model_name in ('biometric.device', 'mail.message', 'mail.followers', 'mail.activity'):
+            self.env[model_name].invalidate_model()
+        return {
+            'last_id': max(device_ids),
+            'devices_deleted': self.devices_deleted + len(device_ids),
+            'messages_deleted': self.messages_deleted + messages_deleted,
+        }
+    
+    def _erase_cleanup(self, batch_size):
+        """Resumen, cupo, claves de idempotencia y tombstones del usuario (un solo paso)"""
+        cr = self.env.cr
+        user_id = self.user_ref
+        
+        cr.execute('DELETE FROM biometric_user_summary_delta WHERE user_id = %s', (user_id,))
+        cr.execute('DELETE FROM biometric_user_summary WHERE user_id = %s', (user_id,))
+        cr.execute('DELETE FROM biometric_device_quota WHERE user_id = %s', (user_id,))
+        cr.execute('DELETE FROM biometric_idempotency_key WHERE user_id = %s', (user_id,))
+        cr.execute('DELETE FROM biometric_device_tombstone WHERE user_id = %s', (user_id,))
+        
+        for model_name in ('biometric.user.summary', 'biometric.idempotency.key',
+                           'biometric.device.tombstone'):
+            self.env[model_name].invalidate_model()
+        return None
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.tools import create_unique_index
+import json
+import logging
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+# Horas que se conserva una clave (ventana en la que un reintento se reconoce)
+IDEMPOTENCY_KEY_RETENTION_HOURS = 48
+# Longitud máxima aceptada para la clave generada por el cliente
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+
+
+class BiometricIdempotencyKey(models.Model):
+    _name = 'biometric.idempotency.key'
+    _description = 'Clave de Idempotencia Biométrica'
+    _order = 'create_date desc, id desc'
+    _rec_name = 'key'
+    
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        required=True,
+        ondelete='cascade'
+    )
+    
+    operation = fields.Char(
+        string='Operación',
+        required=True
+    )
+    
+    key = fields.Char(
+        string='Clave',
+        required=True,
+        help='Clave generada por la app para reconocer reintentos de la misma llamada'
+    )
+    
+    response = fields.Json(
+        string='Respuesta',
+        help='Resultado original devuelto a la app (se repite en los reintentos)'
+    )
+    
+    def init(self):
+        # Destino del ON CONFLICT: una sola ejecución por (usuario, operación, clave)
+        create_unique_index(
+            self._cr,
+            'biometric_idempotency_key_unique_idx',
+            self._table,
+            ['user_id', 'operation', 'key'],
+        )
+    
+    # ============================================
+    # EJECUCIÓN IDEMPOTENTE
+    # ============================================
+    
+    @api.model
+    def _run_once(self, operation, key, func):
+        """
+        Ejecuta ``func`` una sola vez por clave de idempotencia.
+        
+        La clave se reserva con INSERT ... ON CONFLICT DO NOTHING antes de ejecutar:
+        si ya existía, se devuelve la respuesta original sin escribir nada. Una
+        llamada concurrente con la misma clave espera a la primera y falla por
+        serialización; Odoo la reintenta y entonces encuentra la respuesta guardada.
+        Las respuestas fallidas no se guardan, para que el reintento pueda funcionar.
+        
+        Args:
+            operation (str): Nombre de la operación
+            key (str): Clave enviada por la app (None = sin idempotencia)
+            func (callable): Operación a ejecutar, devuelve un dict serializable
+        
+        Returns:
+            dict: Resultado de la operación (original, si es un reintento)
+        """
+        if not key:
+            return func()
+        key = str(key)[:IDEMPOTENCY_KEY_MAX_LENGTH]
+        cr = self.env.cr
+        
+        cr.execute("""
+            INSERT INTO biometric_idempotency_key
+                (user_id, operation, key, create_uid, create_date, write_uid, write_date)
+            VALUES (%(uid)s, %(operation)s, %(key)s, %(uid)s, now() AT TIME ZONE 'UTC',
+                    %(uid)s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (user_id, operation, key) DO NOTHING
+            RETURNING id
+        """, {'uid': self.env.uid, 'operation': operation, 'key': key})
+        row = cr.fetchone()
+        
+        if not row:
+            cr.execute("""
+                SELECT response FROM biometric_idempotency_key
+                WHERE user_id = %s AND operation = %s AND key = %s
+            """, (self.env.uid, operation, key))
+            stored = cr.fetchone()
+            _logger.info(f'Reintento reconocido ({operation}): clave {key}')
+            if stored and stored[0] is not None:
+                return stored[0]
+            return {
+                'success': False,
+                'error': 'La operación con esta clave de idempotencia sigue en curso'
+            }
+        
+        key_id = row[0]
+        try:
+            with cr.savepoint():
+                result = func()
+        except Exception:
+            self.env.invalidate_all(flush=False)
+            cr.execute("DELETE FROM biometric_idempotency_key WHERE id = %s", (key_id,))
+            raise
+        
+        failed = isinstance(result, dict) and (result.get('success') is False or 'error' in result)
+        if failed:
+            cr.execute("DELETE FROM biometric_idempotency_key WHERE id = %s", (key_id,))
+        else:
+            cr.execute(
+                "UPDATE biometric_idempotency_key SET response = %s WHERE id = %s",
+                (json.dumps(result, default=str), key_id),
+            )
+        return result
+    
+    # ============================================
+    # LIMPIEZA
+    # ============================================
+    
+    @api.model
+    def _cron_cleanup(self):
+        """Elimina las claves fuera de la ventana de reintentos"""
+        self.env.cr.execute("""
+            DELETE FROM biometric_idempotency_key WHERE create_date < %s
+        """, (fields.Datetime.now() - timedelta(hours=IDEMPOTENCY_KEY_RETENTION_HOURS),))
+        if self.env.cr.rowcount:
+            _logger.info(f'Claves de idempotencia eliminadas: {self.env.cr.rowcount}')
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import create_index
+import logging
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+# Prefijo obligatorio de los métodos ejecutables como job
+JOB_METHOD_PREFIX = '_job_'
+# Jobs procesados por ejecución del cron
+JOB_BATCH_LIMIT = 200
+# Espera base (segundos) entre reintentos, se duplica en cada intento
+JOB_RETRY_BASE_SECONDS = 30
+# Días que se conservan los jobs finalizados
+JOB_DONE_RETENTION_DAYS = 7
+
+
+class BiometricJob(models.Model):
+    _name = 'biometric.job'
+    _description = 'Tarea Diferida Biométrica'
+    _order = 'eta, id'
+
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    name = fields.Char(
+        string='Descripción',
+        required=True
+    )
+    
+    model_name = fields.Char(
+        string='Modelo',
+        required=True
+    )
+    
+    method_name = fields.Char(
+        string='Método',
+        required=True
+    )
+    
+    res_ids = fields.Json(
+        string='IDs',
+        help='Registros sobre los que se ejecuta el método'
+    )
+    
+    kwargs = fields.Json(
+        string='Argumentos',
+        help='Argumentos con nombre del método'
+    )
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Ejecutar Como',
+        required=True,
+        ondelete='cascade',
+        help='Usuario con el que se ejecuta el job (el que lo encoló)'
+    )
+    
+    # ============================================
+    # ESTADO Y REINTENTOS
+    # ============================================
+    
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Finalizado'),
+        ('failed', 'Fallido')
+    ], string='Estado', default='pending', required=True)
+    
+    eta = fields.Datetime(
+        string='Ejecutar Desde',
+        required=True,
+        default=fields.Datetime.now
+    )
+    
+    attempts = fields.Integer(
+        string='Intentos',
+        default=0
+    )
+    
+    max_attempts = fields.Integer(
+        string='Máximo de Intentos',
+        default=5
+    )
+    
+    last_error = fields.Text(
+        string='Último Error'
+    )
+    
+    done_at = fields.Datetime(
+        string='Finalizado'
+    )
+    
+    def init(self):
+        # El worker solo recorre los pendientes por orden de ejecución
+        create_index(
+            self._cr,
+            'biometric_job_pending_eta_idx',
+            self._table,
+            ['eta', 'id'],
+            where="state = 'pending'",
+        )
+    
+    # ============================================
+    # ENCOLADO
+    # ============================================
+    
+    @api.model
+    def _enqueue(self, records, method_name, description=None, urgent=False, **kwargs):
+        """
+        Encola ``records.method_name(**kwargs)`` para ejecución diferida.
+        
+        Es una única inserción; el trabajo corre luego en el cron con el usuario actual.
+        
+        Args:
+            records (recordset): Registros destino (puede ser vacío para métodos @api.model)
+            method_name (str): Método a ejecutar, debe empezar con '_job_'
+            description (str): Descripción legible
+            urgent (bool): Despertar el worker apenas termine la transacción
+            **kwargs: Argumentos JSON-serializables del método
+            
+        Returns:
+            record: Job creado
+        """
+        if not method_name.startswith(JOB_METHOD_PREFIX) or not hasattr(records, method_name):
+            raise UserError(f'Método de job no válido: {records._name}.{method_name}')
+        
+        job = self.sudo().create({
+            'name': description or f'{records._name}.{method_name}',
+            'model_name': records._name,
+            'method_name': method_name,
+            'res_ids': records.ids,
+            'kwargs': kwargs or None,
+            'user_id': self.env.uid,
+        })
+        
+        if urgent:
+            self.env.ref('biometric_management.cron_biometric_job_runner').sudo()._trigger()
+        
+        return job
+    
+    # ============================================
+    # EJECUCIÓN (CRON)
+    # ============================================
+    
+    @api.model
+    def _cron_run_jobs(self, limit=JOB_BATCH_LIMIT):
+        """
+        Worker: ejecuta los jobs pendientes de a uno, con commit por job.
+        
+        Cada job se toma con FOR UPDATE SKIP LOCKED, por lo que varios workers
+        (o ejecuciones manuales) pueden drenar la cola en paralelo sin bloquearse.
+        """
+        cr = self.env.cr
+        processed = 0
+        
+        while processed < limit:
+            cr.execute("""
+                SELECT id FROM biometric_job
+                WHERE state = 'pending' AND eta <= now() AT TIME ZONE 'UTC'
+                ORDER BY eta, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            row = cr.fetchone()
+            if not row:
+                break
+            
+            self.browse(row[0])._run()
+            cr.commit()
+            processed += 1
+        
+        # Limpieza de jobs finalizados antiguos
+        cr.execute("""
+            DELETE FROM biometric_job
+            WHERE state = 'done' AND done_at < %s
+        """, (fields.Datetime.now() - timedelta(days=JOB_DONE_RETENTION_DAYS),))
+        
+        if processed:
+            _logger.info(f'Jobs biométricos procesados: {processed}')
+    
+    def _run(self):
+        """Ejecuta el job; en caso de error programa un reintento con espera exponencial"""
+        self.ensure_one()
+        now = fields.Datetime.now()
+        
+        try:
+            if not self.method_name.startswith(JOB_METHOD_PREFIX):
+                raise UserError(f'Método de job no válido: {self.method_name}')
+            
+            records = self.env[self.model_name].with_user(self.user_id).browse(self.res_ids or [])
+            with self.env.cr.savepoint():
+                getattr(records, self.method_name)(**(self.kwargs or {}))
+        
+        except Exception as e:
+            self.env.invalidate_all(flush=False)
+            attempts = self.attempts + 1
+            vals = {'attempts': attempts, 'last_error': str(e)}
+            if attempts >= self.max_attempts:
+                vals['state'] = 'failed'
+                _logger.error(f'Job {self.id} ({self.name}) falló definitivamente: {e}')
+            else:
+                vals['eta'] = now + timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                _logger.warning(f'Job {self.id} ({self.name}) falló, intento {attempts}: {e}')
+            self.write(vals)
+        
+        else:
+            self.write({
+                'state': 'done',
+                'attempts': self.attempts + 1,
+                'done_at': now,
+                'last_error': False,
+            })
+    
+    def action_requeue(self):
+        """Vuelve a encolar jobs fallidos"""
+        self.filtered(lambda j: j.state == 'failed').write({
+            'state': 'pending',
+            'attempts': 0,
+            'eta': fields.Datetime.now(),
+        })
\ No newline at end of file
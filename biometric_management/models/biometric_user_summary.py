@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import AccessError
+from odoo.tools import create_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+
+class BiometricUserSummary(models.Model):
+    _name = 'biometric.user.summary'
+    _description = 'Resumen Biométrico por Usuario'
+    _order = 'last_login_at desc, id desc'
+    _rec_name = 'user_id'
+    
+    # ============================================
+    # CAMPOS BÁSICOS
+    # ============================================
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    
+    # ============================================
+    # DISPOSITIVOS
+    # ============================================
+    
+    device_count = fields.Integer(
+        string='Dispositivos',
+        readonly=True,
+        help='Dispositivos registrados (no archivados)'
+    )
+    
+    active_device_count = fields.Integer(
+        string='Dispositivos Activos',
+        readonly=True
+    )
+    
+    # ============================================
+    # AUTENTICACIONES Y SESIONES
+    # ============================================
+    
+    active_session_count = fields.Integer(
+        string='Sesiones Activas',
+        readonly=True
+    )
+    
+    last_login_at = fields.Datetime(
+        string='Último Acceso',
+        readonly=True,
+        help='Última autenticación exitosa (biométrica o tradicional)'
+    )
+    
+    last_failure_at = fields.Datetime(
+        string='Último Fallo',
+        readonly=True
+    )
+    
+    failure_streak = fields.Integer(
+        string='Fallos Consecutivos',
+        readonly=True,
+        help='Intentos fallidos desde la última autenticación exitosa'
+    )
+    
+    version = fields.Integer(
+        string='Versión',
+        readonly=True,
+        help='Se incrementa con cada actualización del resumen'
+    )
+    
+    _sql_constraints = [
+        ('user_unique', 'UNIQUE(user_id)', 'Ya existe un resumen biométrico para este usuario.'),
+    ]
+    
+    def init(self):
+        # Buffer de eventos de autenticación y cierre de sesión: cada evento es una
+        # inserción (sin bloquear la fila del usuario) y _flush_deltas los aplica en
+        # lote. No es UNLOGGED: los contadores no se pueden recalcular desde una fila
+        # perdida sin reconstruir el resumen completo.
+        self._cr.execute("""
+            CREATE TABLE IF NOT EXISTS biometric_user_summary_delta (
+                id bigserial PRIMARY KEY,
+                user_id integer NOT NULL REFERENCES res_users(id) ON DELETE CASCADE,
+                login_at timestamp without time zone,
+                failure_at timestamp without time zone,
+                failures integer NOT NULL DEFAULT 0,
+                session_delta integer NOT NULL DEFAULT 0,
+                created_at timestamp without time zone NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+            )
+        """)
+        create_index(
+            self._cr,
+            'biometric_user_summary_delta_user_idx',
+            'biometric_user_summary_delta',
+            ['user_id', 'id'],
+        )
+    
+    # ============================================
+    # ACTUALIZACIÓN INCREMENTAL
+    # ============================================
+    # Cada evento actualiza una sola fila sin leer dispositivos ni logs: las
+    # pantallas por persona leen solo este registro. Los eventos de autenticación
+    # y sesión pasan por un buffer que un cron aplica en lote.
+    
+    @api.model
+    def _record_auth(self, user_id, success, auth_date, opens_session=False):
+        """
+        Registra un intento de autenticación (y la sesión que abre, si fue exitoso).
+        
+        Va al buffer de eventos en lugar de actualizar la fila del usuario: las
+        autenticaciones concurrentes de un mismo usuario no compiten por ella.
+        """
+        if not user_id:
+            return
+        self.env.cr.execute("""
+            INSERT INTO biometric_user_summary_delta
+                (user_id, login_at, failure_at, failures, session_delta)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (
+            user_id,
+            auth_date if success else None,
+            None if success else auth_date,
+            0 if success else 1,
+            1 if success and opens_session else 0,
+        ))
+    
+    @api.model
+    def _record_sessions_ended(self, user_id, count):
+        """Descuenta sesiones finalizadas (por el buffer de eventos)"""
+        if not user_id or not count:
+            return
+        self.env.cr.execute("""
+            INSERT INTO biometric_user_summary_delta (user_id, session_delta)
+            VALUES (%s, %s)
+        """, (user_id, -count))
+    
+    @api.model
+    def _flush_deltas(self, user_ids=None):
+        """
+        Aplica el buffer de eventos a los resúmenes.
+        
+        Los eventos se aplican en orden de id: un login exitoso reinicia la racha
+        de fallos, que queda en los fallos posteriores a él. Los eventos de
+        transacciones aún no confirmadas quedan para la siguiente ejecución.
+        
+        Args:
+            user_ids (list): Usuarios a consolidar (None = todos)
+        
+        Returns:
+            int: Resúmenes actualizados
+        """
+        cr = self.env.cr
+        params = {'uid': self.env.uid, 'user_ids': list(user_ids or [])}
+        user_filter = 'AND user_id = ANY(%(user_ids)s)' if user_ids else ''
+        cr.execute(f'SELECT max(id) FROM biometric_user_summary_delta WHERE TRUE {user_filter}', params)
+        params['max_id'] = cr.fetchone()[0]
+        if not params['max_id']:
+            return 0
+        
+        # Filas vacías para los usuarios nuevos; así el UPDATE siguiente cubre a todos
+        cr.execute(f"""
+            INSERT INTO biometric_user_summary AS s
+                (user_id, device_count, active_device_count, active_session_count,
+                 failure_streak, version, create_uid, create_date, write_uid, write_date)
+            SELECT DISTINCT user_id, 0, 0, 0, 0, 1,
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM biometric_user_summary_delta
+            WHERE id <= %(max_id)s {user_filter}
+            ON CONFLICT (user_id) DO NOTHING
+        """, params)
+        cr.execute(f"""
+            WITH moved AS (
+                DELETE FROM biometric_user_summary_delta
+                WHERE id <= %(max_id)s {user_filter}
+                RETURNING id, user_id, login_at, failure_at, failures, session_delta
+            ), resets AS (
+                SELECT user_id, max(id) AS reset_id
+                FROM moved
+                WHERE login_at IS NOT NULL
+                GROUP BY user_id
+            ), pending AS (
+                SELECT m.user_id,
+                       max(m.login_at) AS login_at,
+                       max(m.failure_at) AS failure_at,
+                       sum(m.session_delta) AS session_delta,
+                       bool_or(r.reset_id IS NOT NULL) AS resets_streak,
+                       COALESCE(sum(m.failures) FILTER (
+                           WHERE r.reset_id IS NULL OR m.id > r.reset_id), 0) AS failures
+                FROM moved m
+                LEFT JOIN resets r ON r.user_id = m.user_id
+                GROUP BY m.user_id
+            )
+            UPDATE biometric_user_summary AS s
+            SET last_login_at = GREATEST(s.last_login_at, pending.login_at),
+                last_failure_at = GREATEST(s.last_failure_at, pending.failure_at),
+                failure_streak = CASE WHEN pending.resets_streak THEN pending.failures
+                                      ELSE s.failure_streak + pending.failures END,
+                active_session_count = GREATEST(s.active_session_count + pending.session_delta, 0),
+                version = s.version + 1,
+                write_uid = %(uid)s,
+                write_date = now() AT TIME ZONE 'UTC'
+            FROM pending
+            WHERE s.user_id = pending.user_id
+        """, params)
+        updated = cr.rowcount
+        self.invalidate_model()
+        return updated
+    
+    @api.model
+    def _cron_flush_deltas(self):
+        """Cron: aplica el buffer de eventos a los resúmenes"""
+        updated = self._flush_deltas()
+        if updated:
+            _logger.debug(f'Buffer de resúmenes consolidado: {updated} usuarios')
+    
+    @api.model
+    def _get_pending_deltas(self, user_ids):
+        """
+        Eventos aún en el buffer, agregados por usuario (para leer el resumen al día).
+        
+        Returns:
+            dict: {user_id: {'login_at', 'failure_at', 'session_delta',
+                   'resets_streak', 'failures', 'last_id', 'created_at'}}
+        """
+        user_ids = sorted({uid for uid in user_ids if uid})
+        if not user_ids:
+            return {}
+        self.env.cr.execute("""
+            WITH resets AS (
+                SELECT user_id, max(id) AS reset_id
+                FROM biometric_user_summary_delta
+                WHERE user_id = ANY(%(user_ids)s) AND login_at IS NOT NULL
+                GROUP BY user_id
+            )
+            SELECT d.user_id,
+                   max(d.login_at),
+                   max(d.failure_at),
+                   sum(d.session_delta),
+                   bool_or(r.reset_id IS NOT NULL),
+                   COALESCE(sum(d.failures) FILTER (WHERE r.reset_id IS NULL OR d.id > r.reset_id), 0),
+                   max(d.id),
+                   max(d.created_at)
+            FROM biometric_user_summary_delta d
+            LEFT JOIN resets r ON r.user_id = d.user_id
+            WHERE d.user_id = ANY(%(user_ids)s)
+            GROUP BY d.user_id
+        """, {'user_ids': user_ids})
+        keys = ('login_at', 'failure_at', 'session_delta', 'resets_streak',
+                'failures', 'last_id', 'created_at')
+        return {row[0]: dict(zip(keys, row[1:])) for row in self.env.cr.fetchall()}
+    
+    @api.model
+    def _touch(self, user_ids):
+        """
+        Incrementa la versión de los resúmenes sin cambiar contadores.
+        
+        Se usa cuando cambian logs por fuera de los eventos anteriores (edición o
+        borrado manual): la caché de payloads de dispositivos se valida con esta versión.
+        """
+        user_ids = sorted({uid for uid in user_ids if uid})
+        if not user_ids:
+            return
+        self.env.cr.execute("""
+            UPDATE biometric_user_summary
+            SET version = version + 1,
+                write_uid = %s,
+                write_date = now() AT TIME ZONE 'UTC'
+            WHERE user_id = ANY(%s)
+        """, (self.env.uid, user_ids))
+        self.invalidate_model(['version', 'write_uid', 'write_date'])
+    
+    @api.model
+    def _refresh_device_counts(self, user_ids):
+        """
+        Recalcula los contadores de dispositivos de los usuarios indicados.
+        
+        Se llama tras altas, bajas y cambios de estado; el conteo por usuario se
+        resuelve con el índice de dispositivos por usuario.
+        """
+        user_ids = sorted({uid for uid in user_ids if uid})
+        if not user_ids:
+            return
+        self.env['biometric.device'].flush_model(['user_id', 'state', 'active'])
+        self.env.cr.execute("""
+            INSERT INTO biometric_user_summary AS s
+                (user_id, device_count, active_device_count, active_session_count,
+                 failure_streak, version, create_uid, create_date, write_uid, write_date)
+            SELECT u.id,
+                   count(d.id),
+                   count(d.id) FILTER (WHERE d.state = 'active'),
+                   0, 0, 1,
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM unnest(%(user_ids)s) AS u(id)
+            LEFT JOIN biometric_device d ON d.user_id = u.id AND d.active
+            GROUP BY u.id
+            ON CONFLICT (user_id) DO UPDATE SET
+                device_count = EXCLUDED.device_count,
+                active_device_count = EXCLUDED.active_device_count,
+                version = s.version + 1,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, {'user_ids': user_ids, 'uid': self.env.uid})
+        self.invalidate_model()
+    
+    @api.model
+    def _rebuild(self, user_ids=None):
+        """
+        Reconstruye los resúmenes desde dispositivos y logs (instalación o reparación).
+        
+        Args:
+            user_ids (list): Usuarios a reconstruir (None = todos los que tienen datos)
+        """
+        self.env['biometric.device'].flush_model()
+        self.env['biometric.auth.log'].flush_model()
+        params = {'uid': self.env.uid, 'user_ids': list(user_ids or [])}
+        user_filter = 'WHERE u.user_id = ANY(%(user_ids)s)' if user_ids else ''
+        # Los eventos pendientes ya están en los logs que se van a leer
+        self.env.cr.execute(
+            'DELETE FROM biometric_user_summary_delta'
+            + (' WHERE user_id = ANY(%(user_ids)s)' if user_ids else ''),
+            params,
+        )
+        self.env.cr.execute(f"""
+            WITH users AS (
+                SELECT user_id FROM biometric_device
+                UNION
+                SELECT user_id FROM biometric_auth_log
+            ),
+            devices AS (
+                SELECT user_id,
+                       count(*) AS device_count,
+                       count(*) FILTER (WHERE state = 'active') AS active_device_count
+                FROM biometric_device
+                WHERE active
+                GROUP BY user_id
+            ),
+            logs AS (
+                SELECT user_id,
+                       count(*) FILTER (WHERE success AND session_active) AS active_session_count,
+                       max(auth_date) FILTER (WHERE success) AS last_login_at,
+                       max(auth_date) FILTER (WHERE NOT success) AS last_failure_at
+                FROM biometric_auth_log
+                GROUP BY user_id
+            )
+            INSERT INTO biometric_user_summary AS s
+                (user_id, device_count, active_device_count, active_session_count,
+                 last_login_at, last_failure_at, failure_streak, version,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT u.user_id,
+                   COALESCE(d.device_count, 0),
+                   COALESCE(d.active_device_count, 0),
+                   COALESCE(l.active_session_count, 0),
+                   l.last_login_at,
+                   l.last_failure_at,
+                   (SELECT COALESCE(sum(COALESCE(f.occurrence_count, 1)), 0) FROM biometric_auth_log f
+                    WHERE f.user_id = u.user_id AND NOT f.success
+                      AND (l.last_login_at IS NULL OR f.auth_date > l.last_login_at)),
+                   1,
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM users u
+            LEFT JOIN devices d ON d.user_id = u.user_id
+            LEFT JOIN logs l ON l.user_id = u.user_id
+            {user_filter}
+            ON CONFLICT (user_id) DO UPDATE SET
+                device_count = EXCLUDED.device_count,
+                active_device_count = EXCLUDED.active_device_count,
+                active_session_count = EXCLUDED.active_session_count,
+                last_login_at = EXCLUDED.last_login_at,
+                last_failure_at = EXCLUDED.last_failure_at,
+                failure_streak = EXCLUDED.failure_streak,
+                version = s.version + 1,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, params)
+        _logger.info(f'Resúmenes biométricos reconstruidos: {self.env.cr.rowcount}')
+        self.invalidate_model()
+    
+    # ============================================
+    # ACCIONES Y API
+    # ============================================
+    
+    def action_rebuild(self):
+        """Recalcula los resúmenes seleccionados desde el historial"""
+        self._rebuild(self.user_id.ids)
+    
+    def action_view_devices(self):
+        """Abre los dispositivos del usuario"""
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('biometric_management.action_biometric_device')
+        action['domain'] = [('user_id', '=', self.user_id.id)]
+        action['context'] = {'search_default_active_devices': 1}
+        return action
+    
+    def _format_summary_data(self, pending=None):
+        """
+        Formatea el resumen para la API (usuario sin resumen → contadores en cero).
+        
+        Args:
+            pending (dict): Eventos del buffer aún no consolidados (_get_pending_deltas)
+        """
+        self.ensure_one()
+        last_login_at = self.last_login_at
+        last_failure_at = self.last_failure_at
+        active_session_count = self.active_session_count
+        failure_streak = self.failure_streak
+        version = self.version
+        if pending:
+            last_login_at = max(filter(None, [last_login_at, pending['login_at']]), default=None)
+            last_failure_at = max(filter(None, [last_failure_at, pending['failure_at']]), default=None)
+            active_session_count = max(active_session_count + pending['session_delta'], 0)
+            if pending['resets_streak']:
+                failure_streak = pending['failures']
+            else:
+                failure_streak += pending['failures']
+            version += 1
+        return {
+            'userId': self.user_id.id,
+            'deviceCount': self.device_count,
+            'activeDeviceCount': self.active_device_count,
+            'activeSessionCount': active_session_count,
+            'lastLoginAt': last_login_at.isoformat() if last_login_at else None,
+            'lastFailureAt': last_failure_at.isoformat() if last_failure_at else None,
+            'failureStreak': failure_streak,
+            'version': version,
+        }
+    
+    @api.model
+    @api.readonly
+    def get_user_summary(self, user_id=None):
+        """
+        Obtiene el resumen biométrico de un usuario (una sola fila).
+        
+        Args:
+            user_id (int): ID del usuario (None = usuario actual)
+        
+        Returns:
+            dict: Resumen del usuario
+        """
+        if user_id is None:
+            user_id = self.env.user.id
+        user_id = int(user_id)
+        # Los eventos pendientes se leen con SQL (sin reglas de registro)
+        if user_id != self.env.user.id and \
+                not self.env.user.has_group('biometric_management.group_biometric_manager'):
+            raise AccessError('No tienes permiso para acceder a este resumen.')
+        summary = self.search([('user_id', '=', user_id)], limit=1)
+        pending = self._get_pending_deltas([user_id]).get(user_id)
+        if not summary:
+            return self.new({'user_id': user_id})._format_summary_data(pending)
+        return summary._format_summary_data(pending)
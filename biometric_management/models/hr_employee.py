@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class HrEmployee(models.Model):
+    _inherit = 'hr.employee'
+
+    biometric_summary_id = fields.Many2one(
+        related='user_id.biometric_summary_id',
+        string='Resumen Biométrico',
+        groups='biometric_management.group_biometric_manager'
+    )
+    
+    biometric_device_count = fields.Integer(
+        related='user_id.biometric_device_count',
+        string='Dispositivos Biométricos',
+        groups='biometric_management.group_biometric_manager'
+    )
+    
+    def action_open_biometric_summary(self):
+        """Abre el resumen biométrico del usuario vinculado"""
+        self.ensure_one()
+        return self.user_id.action_open_biometric_summary()
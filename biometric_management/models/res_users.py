@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    biometric_summary_id = fields.Many2one(
+        'biometric.user.summary',
+        string='Resumen Biométrico',
+        compute='_compute_biometric_summary_id',
+        groups='biometric_management.group_biometric_manager'
+    )
+    
+    biometric_device_count = fields.Integer(
+        related='biometric_summary_id.device_count',
+        string='Dispositivos Biométricos',
+        groups='biometric_management.group_biometric_manager'
+    )
+    
+    def _compute_biometric_summary_id(self):
+        """Una sola lectura del resumen para todos los usuarios"""
+        summaries = self.env['biometric.user.summary'].search([('user_id', 'in', self.ids)])
+        by_user = {summary.user_id.id: summary for summary in summaries}
+        for user in self:
+            user.biometric_summary_id = by_user.get(user.id, False)
+    
+    def action_open_biometric_summary(self):
+        """Abre el resumen biométrico del usuario (lo crea vacío si aún no existe)"""
+        self.ensure_one()
+        summary = self.biometric_summary_id
+        if not summary:
+            self.env['biometric.user.summary'].sudo()._refresh_device_counts(self.ids)
+            summary = self.env['biometric.user.summary'].search([('user_id', '=', self.id)], limit=1)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Resumen Biométrico',
+            'res_model': 'biometric.user.summary',
+            'res_id': summary.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Enrutamiento de lecturas biométricas a la réplica de PostgreSQL.
+
+Odoo 18 abre los cursores de solo lectura contra ``db_replica_host`` /
+``db_replica_port`` cuando están configurados (sin réplica, contra el primario
+en modo solo lectura). Las rutas de lectura de este módulo y los métodos
+marcados con ``@api.readonly`` usan ese cursor, salvo justo después de una
+escritura biométrica del propio usuario: la réplica podría no haberla recibido
+todavía, así que esas lecturas van al primario (read-your-writes).
+
+Opciones del archivo de configuración de Odoo:
+
+    biometric_replica_reads = True      ; False desactiva el enrutamiento
+    biometric_replica_max_lag = 10      ; segundos al primario tras una escritura
+
+Prueba local con una segunda instancia de PostgreSQL (standby en el puerto 5433):
+
+    odoo-bin -d biometric --db_replica_host=localhost --db_replica_port=5433
+"""
+import time
+
+from odoo.http import request
+from odoo.tools import config, str2bool
+
+# Clave de sesión con el instante hasta el que el usuario lee del primario
+PRIMARY_UNTIL_SESSION_KEY = 'biometric_primary_until'
+# Segundos tras una escritura propia en los que se lee del primario
+DEFAULT_MAX_LAG_SECONDS = 10
+
+
+def replica_reads_enabled():
+    return str2bool(str(config.get('biometric_replica_reads', True)), True)
+
+
+def max_lag_seconds():
+    try:
+        return float(config.get('biometric_replica_max_lag', DEFAULT_MAX_LAG_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_LAG_SECONDS
+
+
+def cursor_on_replica(cr):
+    """
+    Indica si el cursor lee realmente de un standby: solo lectura y con réplica
+    configurada. Sin réplica, los cursores de solo lectura van al primario.
+    """
+    if not getattr(cr, 'readonly', False):
+        return False
+    return bool(config.get('db_replica_host') or config.get('db_replica_port'))
+
+
+def mark_user_write():
+    """
+    Anota en la sesión HTTP que el usuario acaba de escribir (sin petición, no hace nada).
+    
+    Guarda hasta cuándo leer del primario con el doble del margen, y solo reescribe
+    la sesión cuando el valor guardado ya no cubre el margen completo: una ráfaga de
+    escrituras modifica la sesión (y obliga a guardarla) una vez por margen, no en
+    cada petición.
+    """
+    if not request or not request.session.uid:
+        return
+    now = time.time()
+    lag = max_lag_seconds()
+    if request.session.get(PRIMARY_UNTIL_SESSION_KEY, 0) < now + lag:
+        request.session[PRIMARY_UNTIL_SESSION_KEY] = now + 2 * lag
+
+
+def replica_allowed():
+    """Indica si la petición actual puede leer de la réplica"""
+    if not request or not replica_reads_enabled():
+        return False
+    return time.time() > request.session.get(PRIMARY_UNTIL_SESSION_KEY, 0)
+
+
+def readonly_route(controller):
+    """Valor ``readonly`` de las rutas de lectura (``http.route(readonly=...)``)"""
+    return replica_allowed()
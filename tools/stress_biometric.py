@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Arnés de carga concurrente para los caminos de escritura de biometric_management.
+
+Lanza N workers en paralelo contra un Odoo local que comparten usuarios y
+dispositivos (para provocar contención real sobre las mismas filas) y ejecutan
+una mezcla de:
+
+    log_authentication, log_traditional_login, register_device,
+    end_session, destroy_session
+
+Al terminar informa throughput, percentiles de latencia por operación, errores,
+esperas de locks en PostgreSQL (con --pg-dsn) y reintentos por serialización /
+deadlocks de Odoo (con --odoo-log).
+
+Ejemplo:
+
+    python tools/stress_biometric.py --url http://localhost:8069 --db biometric \\
+        --user admin:admin --user demo:demo --workers 32 --duration 60 \\
+        --pg-dsn "dbname=biometric" --odoo-log /var/log/odoo/odoo.log
+
+Requiere ``requests``; ``psycopg2`` solo si se usa --pg-dsn.
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+# Peso de cada operación en la mezcla por defecto
+DEFAULT_MIX = {
+    'log_authentication': 50,
+    'log_traditional_login': 20,
+    'register_device': 10,
+    'end_session': 10,
+    'destroy_session': 10,
+}
+
+# Líneas del log de Odoo que indican reintentos o conflictos de concurrencia
+RETRY_PATTERNS = {
+    'retries': re.compile(r'tries left, try again'),
+    'retries_exhausted': re.compile(r'maximum number of tries reached'),
+    'deadlocks': re.compile(r'deadlock detected'),
+    'serialization_failures': re.compile(r'could not serialize access'),
+}
+
+
+class OdooClient:
+    """Cliente JSON-RPC mínimo con su propia sesión HTTP"""
+
+    def __init__(self, url, db, login, password, timeout=30):
+        self.url = url.rstrip('/')
+        self.http = requests.Session()
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._rpc('/web/session/authenticate', {'db': db, 'login': login, 'password': password})
+
+    def _rpc(self, path, params):
+        response = self.http.post(
+            f'{self.url}{path}',
+            json={'jsonrpc': '2.0', 'method': 'call', 'id': next(self._ids), 'params': params},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('error'):
+            error = payload['error']
+            raise RuntimeError(error.get('data', {}).get('message') or error.get('message'))
+        return payload.get('result')
+
+    def call(self, model, method, *args, **kwargs):
+        return self._rpc(f'/web/dataset/call_kw/{model}/{method}', {
+            'model': model,
+            'method': method,
+            'args': list(args),
+            'kwargs': kwargs,
+        })
+
+
+class DevicePool:
+    """
+    Dispositivos de prueba por usuario, compartidos por todos sus workers (thread-safe).
+
+    Cada UUID tiene una plataforma fija: re-registrarlo desde otro worker envía los
+    mismos datos que el primer alta.
+    """
+
+    def __init__(self, run_tag, logins, size):
+        self.lock = threading.Lock()
+        self.uuids = {
+            login: [f'stress-{run_tag}-{login}-{index}' for index in range(size)]
+            for login in logins
+        }
+        self.platforms = {
+            device_uuid: ('ios', 'android')[index % 2]
+            for uuids in self.uuids.values()
+            for index, device_uuid in enumerate(uuids)
+        }
+        self.registered = {}
+
+    def get(self, device_uuid):
+        with self.lock:
+            return self.registered.get(device_uuid)
+
+    def set(self, device_uuid, device_id):
+        with self.lock:
+            self.registered[device_uuid] = device_id
+
+
+class Stats:
+    """Latencias y errores por operación (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(set)
+
+    def record(self, operation, elapsed, error=None):
+        with self.lock:
+            if error is None:
+                self.latencies[operation].append(elapsed)
+            else:
+                self.errors[operation] += 1
+                if len(self.error_samples[operation]) < 3:
+                    self.error_samples[operation].add(str(error)[:160])
+
+
+class LockSampler(threading.Thread):
+    """Muestrea pg_locks / pg_stat_activity mientras dura la carga"""
+
+    def __init__(self, dsn, interval=0.2):
+        super().__init__(daemon=True)
+        import psycopg2  # opcional: solo si se piden métricas de locks
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.samples = []
+        self.db_counters_start = self._db_counters()
+
+    def _db_counters(self):
+        with self.conn.cursor() as cr:
+            cr.execute("""
+                SELECT deadlocks, conflicts, xact_rollback
+                FROM pg_stat_database WHERE datname = current_database()
+            """)
+            return cr.fetchone()
+
+    def run(self):
+        with self.conn.cursor() as cr:
+            while not self.stop_event.is_set():
+                cr.execute("""
+                    SELECT count(*) FILTER (WHERE wait_event_type = 'Lock'),
+                           COALESCE(max(EXTRACT(EPOCH FROM now() - query_start))
+                                    FILTER (WHERE wait_event_type = 'Lock'), 0)
+                    FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid != pg_backend_pid()
+                """)
+                self.samples.append(cr.fetchone())
+                time.sleep(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        end = self._db_counters()
+        self.conn.close()
+        waiting = [count for count, _ in self.samples] or [0]
+        return {
+            'lock_waiters_avg': statistics.mean(waiting),
+            'lock_waiters_max': max(waiting),
+            'longest_lock_wait_s': max([float(age) for _, age in self.samples] or [0]),
+            'deadlocks': end[0] - self.db_counters_start[0],
+            'conflicts': end[1] - self.db_counters_start[1],
+            'rollbacks': end[2] - self.db_counters_start[2],
+        }
+
+
+def count_log_events(path, offset):
+    """Cuenta reintentos/deadlocks escritos en el log de Odoo desde ``offset``"""
+    counts = dict.fromkeys(RETRY_PATTERNS, 0)
+    with open(path, 'r', errors='replace') as log_file:
+        log_file.seek(offset)
+        for line in log_file:
+            for key, pattern in RETRY_PATTERNS.items():
+                if pattern.search(line):
+                    counts[key] += 1
+    return counts
+
+
+def worker(args, credentials, device_pool, mix, stats, deadline, seed):
+    rng = random.Random(seed)
+    login, password = credentials
+    started = time.perf_counter()
+    try:
+        client = OdooClient(args.url, args.db, login, password)
+    except Exception as e:
+        stats.record('login', time.perf_counter() - started, error=e)
+        return
+    stats.record('login', time.perf_counter() - started)
+    operations, weights = zip(*mix.items())
+
+    # Sesiones tradicionales abiertas por este worker (destroy_session las cierra)
+    sessions = []
+
+    def register(device_uuid):
+        data = client.call('biometric.device', 'register_device', {
+            'device_id': device_uuid,
+            'device_name': f'Stress {device_uuid[-6:]}',
+            'platform': device_pool.platforms[device_uuid],
+            'biometric_type': 'fingerprint',
+        })
+        device_pool.set(device_uuid, data['id'])
+
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        device_uuid = rng.choice(device_pool.uuids[login])
+        device_id = device_pool.get(device_uuid)
+        started = time.perf_counter()
+        try:
+            if operation == 'register_device' or not device_id:
+                operation = 'register_device'
+                register(device_uuid)
+            elif operation == 'log_authentication':
+                success = rng.random() > 0.2
+                client.call(
+                    'biometric.auth.log', 'log_authentication',
+                    device_id=device_id,
+                    success=success,
+                    error_info=None if success else {'code': 'SENSOR', 'message': 'Lectura fallida'},
+                    session_id=uuid.uuid4().hex,
+                    duration_ms=rng.randint(100, 1500),
+                )
+            elif operation == 'log_traditional_login':
+                session_id = uuid.uuid4().hex
+                client.call(
+                    'biometric.auth.log', 'log_traditional_login',
+                    session_id=session_id,
+                    device_info={'device_id': device_uuid, 'platform': device_pool.platforms[device_uuid]},
+                )
+                sessions.append(session_id)
+            elif operation == 'end_session':
+                client.call('biometric.auth.log', 'end_session', device_uuid=device_uuid)
+            elif operation == 'destroy_session':
+                if not sessions:
+                    continue
+                client.call('biometric.auth.log', 'destroy_session', sessions.pop(rng.randrange(len(sessions))))
+        except Exception as e:
+            stats.record(operation, time.perf_counter() - started, error=e)
+        else:
+            stats.record(operation, time.perf_counter() - started)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(stats, elapsed, lock_metrics, log_metrics):
+    total_ok = sum(len(values) for values in stats.latencies.values())
+    total_errors = sum(stats.errors.values())
+    print(f'\nDuración: {elapsed:.1f}s  |  OK: {total_ok}  |  Errores: {total_errors}  '
+          f'|  Throughput: {total_ok / elapsed:.1f} ops/s\n')
+    print(f'{"operación":<24}{"ok":>8}{"err":>6}{"ops/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for operation in sorted(set(stats.latencies) | set(stats.errors)):
+        values = stats.latencies.get(operation) or [0]
+        print(f'{operation:<24}{len(stats.latencies.get(operation, [])):>8}{stats.errors.get(operation, 0):>6}'
+              f'{len(stats.latencies.get(operation, [])) / elapsed:>9.1f}'
+              f'{percentile(values, 50) * 1000:>9.0f}{percentile(values, 95) * 1000:>9.0f}'
+              f'{percentile(values, 99) * 1000:>9.0f}{max(values) * 1000:>9.0f}')
+    for operation, samples in stats.error_samples.items():
+        for sample in samples:
+            print(f'  ! {operation}: {sample}')
+    if lock_metrics:
+        print('\nPostgreSQL:')
+        for key, value in lock_metrics.items():
+            print(f'  {key:<24}{value:>10.2f}' if isinstance(value, float) else f'  {key:<24}{value:>10}')
+    if log_metrics:
+        print('\nLog de Odoo:')
+        for key, value in log_metrics.items():
+            print(f'  {key:<24}{value:>10}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Carga concurrente sobre biometric_management')
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--user', action='append', required=True, metavar='LOGIN:PASSWORD',
+                        help='Credenciales (repetible); los workers se reparten entre usuarios')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='Segundos de carga')
+    parser.add_argument('--devices', type=int, default=3,
+                        help='Dispositivos compartidos por usuario (menos = más contención)')
+    parser.add_argument('--mix', default=None,
+                        help='Pesos op=peso separados por coma, ej. log_authentication=80,end_session=20')
+    parser.add_argument('--pg-dsn', default=None, help='DSN de PostgreSQL para métricas de locks')
+    parser.add_argument('--odoo-log', default=None, help='Log de Odoo para contar reintentos')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    credentials = [tuple(value.split(':', 1)) for value in args.user]
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {op: int(weight) for op, weight in (item.split('=') for item in args.mix.split(','))}
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise SystemExit(f'Operaciones desconocidas: {", ".join(sorted(unknown))}')
+
+    device_pool = DevicePool(uuid.uuid4().hex[:8], [login for login, _ in credentials], args.devices)
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+
+    log_offset = os.path.getsize(args.odoo_log) if args.odoo_log else None
+    sampler = LockSampler(args.pg_dsn) if args.pg_dsn else None
+    if sampler:
+        sampler.start()
+
+    stats = Stats()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(args, credentials[index % len(credentials)], device_pool, mix, stats, deadline, seed + index),
+            daemon=True,
+        )
+        for index in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    lock_metrics = sampler.stop() if sampler else None
+    log_metrics = count_log_events(args.odoo_log, log_offset) if args.odoo_log else None
+    report(stats, elapsed, lock_metrics, log_metrics)
+
+
+if __name__ == '__main__':
+    main()